@@ -20,5 +20,8 @@ setuptools.setup(
         "biopython>=1.78",
     ],
     packages=setuptools.find_packages(),
+    entry_points={
+        "console_scripts": ["zjb-batch-render = zjb.gui.batch_render:main"],
+    },
     include_package_data=True,
 )
@@ -0,0 +1,349 @@
+"""无界面的图谱/脑区数值图批量渲染
+
+不打开主界面, 在离屏Qt平台上复用:py:class:`AtlasSurfaceViewWidget`的渲染流程, 把多个被试的
+图谱分区或脑区数值(如`AnalysisResult`的数据)批量渲染为PNG, 多个被试在进程池中并行渲染.
+
+命令行用法::
+
+    python -m zjb.gui.batch_render WORKSPACE -o OUTPUT_DIR --atlas AAL90 --values degree -j 4
+
+每个工作进程独立打开工作空间(不启动worker)并创建自己的QApplication和OpenGL上下文.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+MONTAGE = "montage"
+"""多视角蒙太奇布局, 见:py:data:`.widgets.surface_montage_view.MONTAGE_VIEWS`"""
+SINGLE = "single"
+"""单一视角(默认相机)布局"""
+DEFAULT_SIZE = (600, 450)
+"""每个视角的默认图像大小"""
+
+
+class RenderJob(NamedTuple):
+    """一张图像的渲染任务"""
+
+    subject: str
+    """被试名称"""
+    atlas: str
+    """图谱名称"""
+    output: str
+    """输出的PNG路径"""
+    values: "str | None" = None
+    """脑区数值: .npy文件路径或被试数据中的项目名, 为None时渲染图谱分区"""
+    vmin: "float | None" = None
+    """颜色范围下限, 默认为数值的最小值"""
+    vmax: "float | None" = None
+    """颜色范围上限, 默认为数值的最大值"""
+    layout: str = MONTAGE
+    """布局, :py:data:`MONTAGE`或:py:data:`SINGLE`"""
+    size: "tuple[int, int]" = DEFAULT_SIZE
+    """每个视角的图像大小"""
+
+
+_APP = None
+_WORKSPACE = None
+_VIEW = None
+"""工作进程中复用的表面视图, 各任务只替换图谱表面和颜色"""
+_MONTAGE = None
+"""工作进程中复用的蒙太奇, 表面几何不变时各任务共享"""
+
+
+def _init_worker(workspace_path: str, platform: str):
+    """在工作进程中创建离屏QApplication并打开工作空间"""
+    global _APP, _WORKSPACE
+    os.environ["QT_QPA_PLATFORM"] = platform
+    from PyQt5.QtWidgets import QApplication
+
+    from zjb.doj.lmdb_job_manager import LMDBJobManager
+    from zjb.main.api import Workspace
+
+    _APP = QApplication.instance() or QApplication([sys.argv[0]])
+    _WORKSPACE = Workspace.from_manager(LMDBJobManager(path=workspace_path))
+
+
+def _find(items, name: str, kind: str):
+    for item in items:
+        if item.name == name:
+            return item
+    raise KeyError(f"{kind} '{name}' not found in the workspace")
+
+
+def _load_values(subject, values: str, n_regions: int):
+    """读取脑区数值, 来自.npy文件或被试数据中的项目(取其`data`属性)"""
+    if values.endswith(".npy"):
+        data = np.load(values)
+    else:
+        data = subject.data[values]
+        data = getattr(data, "data", data)
+    data = np.asarray(data, dtype=float).ravel()
+    if len(data) != n_regions:
+        raise ValueError(
+            f"'{values}' has {len(data)} values, the atlas has {n_regions} regions"
+        )
+    return data
+
+
+def _mapping_regions(surface_region_mapping) -> int:
+    """脑区映射中的脑区数(最大的脑区编号加一)"""
+    return int(np.max(surface_region_mapping.data)) + 1
+
+
+def _view():
+    """工作进程中复用的表面视图, 不需要交互时的简化网格和拾取"""
+    global _VIEW
+    if _VIEW is None:
+        from .widgets.atlas_surface_view_widget import AtlasSurfaceViewWidget
+
+        _VIEW = AtlasSurfaceViewWidget()
+        _VIEW.setLodEnabled(False)
+        _VIEW.setPickingEnabled(False)
+    return _VIEW
+
+
+def _montage(widget):
+    """与`widget`当前表面几何对应的蒙太奇, 表面改变时释放旧的蒙太奇及其OpenGL视图"""
+    global _MONTAGE
+    from PyQt5.QtCore import QCoreApplication, QEvent
+
+    from .widgets.surface_montage_view import SurfaceMontageView
+
+    if _MONTAGE is not None and _MONTAGE.geometry is widget.geometry:
+        return _MONTAGE
+    if _MONTAGE is not None:
+        widget.vertexColorsChanged.disconnect(_MONTAGE.sync)
+        _MONTAGE.deleteLater()
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    _MONTAGE = SurfaceMontageView(widget)
+    return _MONTAGE
+
+
+def _render(job: RenderJob) -> str:
+    """在工作进程中渲染一张图像, 返回输出路径"""
+    from PyQt5.QtGui import QImage
+
+    from .common.colormaps import resource_colormap
+    from .common.movie_export import _to_rgb
+    from .common.surface_cache import find_surface_data
+    from .common.vertex_colors import RegionColorizer, VertexColorEngine
+    from .widgets.surface_montage_view import MONTAGE_VIEWS
+
+    subject = _find(_WORKSPACE.subjects, job.subject, "Subject")
+    atlas = _find(_WORKSPACE.atlases, job.atlas, "Atlas")
+    surface, surface_region_mapping = find_surface_data(subject)
+    if surface is None or surface_region_mapping is None:
+        raise ValueError(f"Subject '{job.subject}' has no surface")
+    if _mapping_regions(surface_region_mapping) != atlas.number_of_regions:
+        raise ValueError(
+            f"The surface region mapping of '{job.subject}' does not match "
+            f"atlas '{job.atlas}'"
+        )
+
+    widget = _view()
+    widget.setAtlas(atlas, surface, surface_region_mapping)
+    labels = widget.geometry.labels
+    n_regions = atlas.number_of_regions
+    if job.values is None:
+        # 与图谱页面默认的分区着色相同
+        widget.setColorMap("tab20", source="matplotlib")
+        values = np.resize(np.linspace(0, 1, 20), n_regions)
+        colors = RegionColorizer(labels).render(widget.color_map, values)
+    else:
+        widget.color_map = resource_colormap("CET-ZJB").color_map
+        values = _load_values(subject, job.values, n_regions)
+        engine = VertexColorEngine(widget.color_map, labels, n_regions)
+        engine.set_range(
+            np.nanmin(values) if job.vmin is None else job.vmin,
+            np.nanmax(values) if job.vmax is None else job.vmax,
+        )
+        colors = engine.render(values)
+    widget.setVertexColors(colors)
+
+    w, h = job.size
+    if job.layout == MONTAGE:
+        montage = _montage(widget)
+        montage.resize(3 * w, 2 * h)
+        montage.show()
+        _APP.processEvents()
+        montage.sync()
+        image = np.zeros((2 * h, 3 * w, 3), dtype=np.uint8)
+        for view, (*_, row, column) in zip(montage.views, MONTAGE_VIEWS):
+            image[row * h : (row + 1) * h, column * w : (column + 1) * w] = _to_rgb(
+                view.renderToArray((w, h)), (w, h)
+            )
+        montage.hide()
+    else:
+        widget.resize(w, h)
+        widget.show()
+        _APP.processEvents()
+        image = _to_rgb(widget.renderToArray((w, h)), (w, h))
+        widget.hide()
+
+    Path(job.output).parent.mkdir(parents=True, exist_ok=True)
+    height, width = image.shape[:2]
+    qimage = QImage(image.data, width, height, 3 * width, QImage.Format_RGB888)
+    if not qimage.save(job.output):
+        raise OSError(f"Failed to write {job.output}")
+    return job.output
+
+
+def batch_render(
+    workspace_path: str,
+    jobs: "list[RenderJob]",
+    processes: int = 0,
+    platform: str = "offscreen",
+    progress=None,
+):
+    """在进程池中渲染一批图像
+
+    Parameters
+    ----------
+    workspace_path : str
+        工作空间路径
+    jobs : list[RenderJob]
+        渲染任务
+    processes : int, optional
+        工作进程数, 为0时取CPU核数(不超过任务数)
+    platform : str, optional
+        Qt平台插件, 没有离屏OpenGL支持时可以在xvfb中使用"xcb", by default "offscreen"
+    progress : Callable[[RenderJob, str | None, Exception | None], None], optional
+        每个任务完成时调用, 参数为任务, 输出路径和异常
+
+    Returns
+    -------
+    list[tuple[RenderJob, Exception]]
+        失败的任务及其异常
+    """
+    processes = processes or min(os.cpu_count() or 1, max(len(jobs), 1))
+    failures = []
+    # spawn启动的工作进程不会继承主进程中可能已经存在的Qt和OpenGL状态
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(workspace_path, platform),
+    ) as executor:
+        futures = {executor.submit(_render, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                output, error = future.result(), None
+            except Exception as e:
+                output, error = None, e
+                failures.append((job, e))
+            if progress is not None:
+                progress(job, output, error)
+    return failures
+
+
+def _parse_size(text: str):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m zjb.gui.batch_render",
+        description="Render atlas parcellations or regional value maps to PNG "
+        "without opening the GUI.",
+    )
+    parser.add_argument("workspace", help="workspace path")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument(
+        "--subjects", nargs="*", help="subject names (default: all subjects)"
+    )
+    parser.add_argument(
+        "--atlas", nargs="*", dest="atlases", help="atlas names (default: all atlases)"
+    )
+    parser.add_argument(
+        "--values",
+        help="regional values: a .npy file or the name of a data item of each subject "
+        "(default: render the parcellation)",
+    )
+    parser.add_argument("--vmin", type=float, help="lower bound of the colour range")
+    parser.add_argument("--vmax", type=float, help="upper bound of the colour range")
+    parser.add_argument("--layout", choices=(MONTAGE, SINGLE), default=MONTAGE)
+    parser.add_argument(
+        "--size",
+        type=_parse_size,
+        default=DEFAULT_SIZE,
+        help="size of each view, e.g. 600x450",
+    )
+    parser.add_argument(
+        "-j", "--processes", type=int, default=0, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--platform", default="offscreen", help="Qt platform plugin (default: offscreen)"
+    )
+    args = parser.parse_args(argv)
+
+    # 主进程只读取被试, 图谱和脑区映射, 不进行渲染
+    from zjb.doj.lmdb_job_manager import LMDBJobManager
+    from zjb.main.api import Workspace
+
+    from .common.surface_cache import find_surface_data
+
+    workspace = Workspace.from_manager(LMDBJobManager(path=args.workspace))
+    subjects = [
+        subject
+        for subject in workspace.subjects
+        if not args.subjects or subject.name in args.subjects
+    ]
+    atlases = [
+        atlas
+        for atlas in workspace.atlases
+        if not args.atlases or atlas.name in args.atlases
+    ]
+    suffix = f"_{Path(args.values).stem}" if args.values else ""
+    jobs = []
+    for subject in subjects:
+        _, surface_region_mapping = find_surface_data(subject)
+        if surface_region_mapping is None:
+            print(f"Skipping {subject.name}: no surface region mapping")
+            continue
+        # 被试只有一个脑区映射, 只渲染脑区数与之相同的图谱
+        n_regions = _mapping_regions(surface_region_mapping)
+        for atlas in atlases:
+            if atlas.number_of_regions != n_regions:
+                print(
+                    f"Skipping {subject.name} / {atlas.name}: the surface region "
+                    f"mapping has {n_regions} regions, the atlas has "
+                    f"{atlas.number_of_regions}"
+                )
+                continue
+            jobs.append(
+                RenderJob(
+                    subject.name,
+                    atlas.name,
+                    str(Path(args.output) / f"{subject.name}_{atlas.name}{suffix}.png"),
+                    args.values,
+                    args.vmin,
+                    args.vmax,
+                    args.layout,
+                    args.size,
+                )
+            )
+
+    done = 0
+
+    def progress(job: RenderJob, output, error):
+        nonlocal done
+        done += 1
+        status = output if error is None else f"FAILED: {error}"
+        print(f"[{done}/{len(jobs)}] {job.subject} / {job.atlas}: {status}")
+
+    failures = batch_render(
+        args.workspace, jobs, args.processes, args.platform, progress
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""时间序列的分块(out-of-core)访问模块
+
+长时间, 高分辨率仿真的时间序列可以保存在np.memmap或分块存储(如h5py/zarr数据集)中,
+可视化时只按时间分块读入可见的时间窗口和当前的动画帧, 并用有界的LRU缓存保存最近读过的块.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CHUNK_BYTES = 4 * 1024**2
+"""每个块的目标大小(bytes)"""
+CACHE_BYTES = 256 * 1024**2
+"""每个时间序列的块缓存上限(bytes)"""
+WIDE_ROW_BYTES = 256 * 1024
+"""每帧不小于该大小(bytes)的时间序列(如顶点级时间序列)逐帧读取"""
+WIDE_RESIDENT_FRAMES = 2
+"""逐帧读取时缓存的帧数, 即当前帧和下一帧"""
+
+
+class ChunkedSeries:
+    """按时间分块访问的(时间, 空间)时间序列
+
+    支持`series[t]`读取单帧, `series[t0:t1]`和`series[t0:t1, columns]`读取时间窗口.
+
+    Parameters
+    ----------
+    source : ArrayLike
+        支持切片的数据源, 如np.memmap, h5py或zarr数据集
+    chunk_rows : int, optional
+        每个块包含的时间点数, 默认按:py:data:`CHUNK_BYTES`计算
+    cache_bytes : int, optional
+        块缓存的上限, by default :py:data:`CACHE_BYTES`
+    """
+
+    def __init__(self, source, chunk_rows: int = 0, cache_bytes: int = CACHE_BYTES):
+        self.source = source
+        self.shape = tuple(source.shape)
+        self.dtype = np.dtype(source.dtype)
+        self.ndim = len(self.shape)
+        row_bytes = max(int(np.prod(self.shape[1:])) * self.dtype.itemsize, 1)
+        self.chunk_rows = chunk_rows or max(CHUNK_BYTES // row_bytes, 1)
+        self.max_chunks = max(cache_bytes // (self.chunk_rows * row_bytes), 2)
+        self._chunks: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_npy(cls, path, **kwargs):
+        """以内存映射的方式打开.npy文件"""
+        return cls(np.load(path, mmap_mode="r"), **kwargs)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, columns = key[0], key[1:]
+        else:
+            rows, columns = key, ()
+        if isinstance(rows, (int, np.integer)):
+            return self.frame(int(rows))[columns] if columns else self.frame(int(rows))
+        if isinstance(rows, slice) and rows.step in (None, 1):
+            start, stop, _ = rows.indices(self.shape[0])
+            return self.window(start, stop, *columns)
+        # 其它索引方式直接交给数据源
+        return np.asarray(self.source[key])
+
+    def frame(self, index: int):
+        """读取第`index`帧"""
+        chunk = self._chunk(index // self.chunk_rows)
+        return chunk[index % self.chunk_rows]
+
+    def window(self, start: int, stop: int, columns=slice(None)):
+        """读取[start, stop)时间窗口内的数据"""
+        stop = max(stop, start)
+        first, last = start // self.chunk_rows, -(-stop // self.chunk_rows)
+        blocks = []
+        for index in range(first, last):
+            offset = index * self.chunk_rows
+            chunk = self._chunk(index)
+            blocks.append(
+                chunk[max(start - offset, 0) : stop - offset][:, columns]
+            )
+        if not blocks:
+            return np.empty((0,) + np.empty(self.shape[1:])[columns].shape, self.dtype)
+        return np.concatenate(blocks)
+
+    def iter_chunks(self, rows: int = 0):
+        """按时间顺序遍历所有块, 用于流式计算, 不占用块缓存
+
+        Yields
+        ------
+        tuple[int, np.ndarray]
+            块的起始时间点及块数据
+        """
+        rows = rows or self.chunk_rows
+        for start in range(0, self.shape[0], rows):
+            yield start, np.asarray(self.source[start : start + rows])
+
+    def _chunk(self, index: int):
+        with self._lock:
+            if index in self._chunks:
+                self._chunks.move_to_end(index)
+                return self._chunks[index]
+        start = index * self.chunk_rows
+        chunk = np.asarray(self.source[start : start + self.chunk_rows])
+        with self._lock:
+            self._chunks[index] = chunk
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return chunk
+
+
+def is_out_of_core(data):
+    """判断数据是否不在内存中(内存映射或分块存储)"""
+    return isinstance(data, (np.memmap, ChunkedSeries)) or not isinstance(
+        data, np.ndarray
+    )
+
+
+def iter_blocks(data, rows: int):
+    """按时间顺序以`rows`行为单位遍历任意时间序列数据"""
+    if isinstance(data, ChunkedSeries):
+        yield from data.iter_chunks(rows)
+        return
+    for start in range(0, data.shape[0], rows):
+        yield start, np.asarray(data[start : start + rows])
+
+
+_VIEWS: "OrderedDict[str, ChunkedSeries]" = OrderedDict()
+_VIEWS_LOCK = threading.Lock()
+_VIEWS_MAXSIZE = 8
+
+
+def get_series_data(time_series):
+    """获取用于可视化的时间序列数据
+
+    内存中的ndarray直接返回; 内存映射或分块存储的数据包装为:py:class:`ChunkedSeries`,
+    同一个时间序列(按gid)共享同一个块缓存, 最多缓存最近使用的8个时间序列, 页面关闭时
+    通过:py:func:`release_series_data`释放. 每帧很大的时间序列逐帧读取, 只保留
+    :py:data:`WIDE_RESIDENT_FRAMES`帧.
+    """
+    data = time_series.data
+    if not is_out_of_core(data) or isinstance(data, ChunkedSeries):
+        return data
+    key = time_series._gid.str
+    with _VIEWS_LOCK:
+        if key in _VIEWS:
+            _VIEWS.move_to_end(key)
+            return _VIEWS[key]
+        row_bytes = int(np.prod(data.shape[1:])) * np.dtype(data.dtype).itemsize
+        if row_bytes >= WIDE_ROW_BYTES:
+            view = ChunkedSeries(data, 1, cache_bytes=WIDE_RESIDENT_FRAMES * row_bytes)
+        else:
+            view = ChunkedSeries(data)
+        _VIEWS[key] = view
+        while len(_VIEWS) > _VIEWS_MAXSIZE:
+            _VIEWS.popitem(last=False)
+        return view
+
+
+def release_series_data(key: str):
+    """释放时间序列(按gid)共享的块缓存, 仍在使用它的对象不受影响"""
+    with _VIEWS_LOCK:
+        _VIEWS.pop(key, None)
@@ -0,0 +1,58 @@
+from matplotlib.figure import Figure
+from matplotlib.text import Text
+
+from ..libs import pycircos
+
+CHORD_RADIUS = 735
+"""连线端点所在的半径(环的内侧)"""
+
+
+def export_circos(labels, edges, file_name: str, format: str = "pdf"):
+    """用matplotlib绘制脑区连接的环形图并保存到文件
+
+    Parameters
+    ----------
+    labels : ArrayLike
+        图谱的脑区名称, 每个脑区一段弧
+    edges : Iterable[tuple[int, int, float]]
+        (起点脑区编号, 终点脑区编号, 权重), 如:py:class:`.edge_selection.EdgeSelection`
+    file_name : str
+        不含扩展名的输出路径
+    format : str, optional
+        输出格式, by default "pdf"
+    """
+    # 不经过pyplot创建图形, 导出后即可释放, 不会在pyplot中累积
+    circle = pycircos.Gcircle(fig=Figure(figsize=(8, 8)), figsize=(8, 8))
+    circle.fig_is_ext = False  # 坐标轴占满整个图形
+    colors = pycircos.Garc.colorlist
+    for i, region_label in enumerate(labels):
+        arc = pycircos.Garc(
+            arc_id=region_label,
+            facecolor=colors[i % len(colors)],
+            size=20,
+            interspace=0.5,
+            raxis_range=(CHORD_RADIUS, 785),
+            labelposition=100,
+            label_visible=True,
+            labelsize=5,
+        )
+        circle.add_garc(arc)
+    circle.set_garcs(0, 360)
+
+    labels = list(labels)
+    for name1_index, name2_index, _ in edges:
+        name1 = "".join(labels[name1_index].rstrip())
+        name2 = "".join(labels[name2_index].rstrip())
+        circle.chord_plot(
+            (name1, 5, 15, CHORD_RADIUS),
+            (name2, 5, 15, CHORD_RADIUS),
+            facecolor=circle.garc_dict[name1].facecolor,
+            edgecolor=circle.garc_dict[name1].facecolor,
+            linewidth=0.5,
+        )
+
+    circle.ax.set_facecolor("black")
+    for text in circle.ax.findobj(match=Text):
+        text.set_color("white")
+    circle.figure.set_facecolor("black")
+    circle.save(file_name, format=format)
@@ -0,0 +1,137 @@
+"""进程级共享的颜色映射注册表
+
+颜色映射(包括`colorbar/`下的CSV文件)在首次使用时加载一次, 同时预先计算好
+float32和uint8两种格式, :py:data:`LUT_SIZES`中各种大小的颜色查找表(LUT).
+表面, 连接矩阵和时间序列等所有控件都从这里获取颜色映射, 不再重复读取文件和插值.
+"""
+import threading
+
+import numpy as np
+import pyqtgraph as pg
+
+from .._rc import find_resource_file
+
+LUT_SIZES = (256, 4096)
+"""预先计算的查找表大小"""
+MAP_LUT_SIZE = 4096
+"""通过查找表映射数值时使用的查找表大小"""
+COLORMAP_SOURCES = ("matplotlib", "colorcet")
+"""可供选择的颜色映射来源"""
+
+
+class ColorMapEntry:
+    """注册表中的一个颜色映射及其预先计算的查找表
+
+    Attributes
+    ----------
+    name : str
+        颜色映射名称或CSV文件路径
+    source : str | None
+        颜色映射来源
+    color_map : pg.ColorMap
+        颜色映射
+    """
+
+    def __init__(self, name: str, source, color_map):
+        self.name = name
+        self.source = source
+        self.color_map = color_map
+        self._luts: "dict[tuple[int, str], np.ndarray]" = {}
+        for size in LUT_SIZES:
+            self.lut(size, "float")
+            self.lut(size, "byte")
+
+    def lut(self, size: int = 256, mode: str = "float") -> np.ndarray:
+        """获取(size, 4)的只读查找表
+
+        Parameters
+        ----------
+        size : int, optional
+            查找表大小, by default 256
+        mode : str, optional
+            "float"为[0, 1]内的float32颜色, "byte"为uint8颜色, by default "float"
+        """
+        key = (size, mode)
+        lut = self._luts.get(key)
+        if lut is None:
+            if mode == "byte":
+                lut = np.round(self.lut(size, "float") * 255).astype(np.uint8)
+            else:
+                lut = np.asarray(
+                    self.color_map.getLookupTable(
+                        0.0, 1.0, nPts=size, alpha=True, mode="float"
+                    ),
+                    dtype=np.float32,
+                )
+            lut.flags.writeable = False
+            self._luts[key] = lut
+        return lut
+
+    def map(self, values, mode: str = "float") -> np.ndarray:
+        """通过查找表把[0, 1]内的数值映射为颜色, 与`pg.ColorMap.map`相比不需要插值
+
+        Returns
+        -------
+        np.ndarray
+            (..., 4)的颜色, 为新建数组
+        """
+        lut = self.lut(MAP_LUT_SIZE, mode)
+        indices = np.asarray(values, dtype=np.float32) * (MAP_LUT_SIZE - 1)
+        indices = np.nan_to_num(indices)
+        np.clip(indices, 0, MAP_LUT_SIZE - 1, out=indices)
+        return lut.take(np.rint(indices).astype(np.intp), axis=0)
+
+
+_ENTRIES: "dict[tuple[str, str | None], ColorMapEntry]" = {}
+# 以颜色映射对象的id为键, 条目持有颜色映射的引用, 因此id不会被复用
+_BY_MAP: "dict[int, ColorMapEntry]" = {}
+_NAMES: "dict[str, list[str]]" = {}
+_LOCK = threading.RLock()
+
+
+def get_colormap(name: str, source=None) -> ColorMapEntry:
+    """获取颜色映射, 首次获取时加载并计算查找表
+
+    Parameters
+    ----------
+    name : str
+        颜色映射名称, `source`为None时为CSV文件路径
+    source : str, optional
+        颜色映射来源, 如"matplotlib"或"colorcet", by default None
+    """
+    key = (name, source)
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None:
+            color_map = pg.colormap.get(name, source=source, skipCache=True)
+            entry = ColorMapEntry(name, source, color_map)
+            _ENTRIES[key] = entry
+            _BY_MAP[id(color_map)] = entry
+        return entry
+
+
+def resource_colormap(name: str) -> ColorMapEntry:
+    """获取`colorbar/`目录下的CSV颜色映射, 如`resource_colormap("CET-ZJB")`"""
+    return get_colormap("./" + find_resource_file(f"colorbar/{name}.csv", abs=False))
+
+
+def list_colormaps(source: str) -> "list[str]":
+    """列出某个来源的所有颜色映射名称(不区分大小写排序), 结果只计算一次"""
+    with _LOCK:
+        names = _NAMES.get(source)
+        if names is None:
+            names = sorted(pg.colormap.listMaps(source), key=lambda x: x.lower())
+            _NAMES[source] = names
+        return list(names)
+
+
+def colormap_entry(color_map) -> ColorMapEntry:
+    """获取颜色映射对象对应的注册表条目, 不在注册表中的颜色映射会被注册"""
+    if isinstance(color_map, ColorMapEntry):
+        return color_map
+    with _LOCK:
+        entry = _BY_MAP.get(id(color_map))
+        if entry is None or entry.color_map is not color_map:
+            entry = ColorMapEntry(getattr(color_map, "name", ""), None, color_map)
+            _BY_MAP[id(color_map)] = entry
+        return entry
@@ -0,0 +1,101 @@
+"""热图的多分辨率(块最大值/平均值)金字塔, 为连接矩阵热图提供细节层次(LOD)显示
+"""
+import numpy as np
+
+POOLING_MODES = ("max", "mean")
+"""块池化方式: 最大值可以保留缩小后的强连接, 平均值反映整体的连接强度"""
+
+
+class HeatmapPyramid:
+    """二维热图的块池化金字塔
+
+    第0层为原始图像, 第k层将原始图像按`factor**k x factor**k`的块池化, 末尾不足一块的部分单独成块.
+    NaN不参与池化, 整块都是NaN时结果为NaN. 显示时按每个像素覆盖的单元数选择层级,
+    并只截取可见的窗口, 因此每次更新的图像大小与控件的像素数相当, 与矩阵大小无关.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (行, 列)的热图
+    mode : str, optional
+        池化方式, :py:data:`POOLING_MODES`之一, by default "max"
+    factor : int, optional
+        相邻两层之间的池化倍数, by default 2
+    min_size : int, optional
+        最粗一层的边长不小于该值, by default 64
+    """
+
+    def __init__(
+        self, image, mode: str = "max", factor: int = 2, min_size: int = 64
+    ):
+        if mode not in POOLING_MODES:
+            raise ValueError(f"Unknown pooling mode '{mode}'")
+        self.mode = mode
+        self.factor = factor
+        self.images = [np.asarray(image, dtype=float)]
+        self.block_sizes = [1]
+        while max(self.images[-1].shape) // factor >= min_size:
+            self.images.append(_pool(self.images[-1], factor, mode))
+            self.block_sizes.append(self.block_sizes[-1] * factor)
+
+    @property
+    def levels(self):
+        """金字塔的层数(包括原始图像)"""
+        return len(self.images)
+
+    @property
+    def shape(self):
+        """原始图像的形状"""
+        return self.images[0].shape
+
+    def level_for(self, cells_per_pixel: float):
+        """选择每个块仍不小于一个像素的最粗层, 即每个像素覆盖`cells_per_pixel`个单元时的层级"""
+        level = 0
+        while (
+            level + 1 < self.levels and self.block_sizes[level + 1] <= cells_per_pixel
+        ):
+            level += 1
+        return level
+
+    def window(self, level: int, rows: "tuple[float, float]", columns, margin=0.5):
+        """截取第`level`层中覆盖原始图像行列范围的窗口
+
+        Parameters
+        ----------
+        level : int
+            层级
+        rows, columns : tuple[float, float]
+            原始图像中可见的行, 列范围
+        margin : float, optional
+            在可见范围的每一侧额外截取的比例, 平移时不必立即更新, by default 0.5
+
+        Returns
+        -------
+        tuple[np.ndarray, tuple[int, int]]
+            窗口图像(每个像素是一个块)及其左上角在原始图像中的(行, 列)
+        """
+        size = self.block_sizes[level]
+        image = self.images[level]
+        bounds = []
+        for (lo, hi), n_blocks in zip((rows, columns), image.shape):
+            extra = (hi - lo) * margin
+            b0 = int(np.clip(np.floor((lo - extra) / size), 0, n_blocks))
+            b1 = int(np.clip(np.ceil((hi + extra) / size), b0, n_blocks))
+            bounds.append((b0, b1))
+        (r0, r1), (c0, c1) = bounds
+        return image[r0:r1, c0:c1], (r0 * size, c0 * size)
+
+
+def _pool(image, factor: int, mode: str):
+    """将图像按`factor x factor`的块池化, 末尾不足一块的部分以NaN补齐"""
+    rows, columns = (-(-n // factor) * factor for n in image.shape)
+    padded = np.full((rows, columns), np.nan)
+    padded[: image.shape[0], : image.shape[1]] = image
+    blocks = padded.reshape(rows // factor, factor, columns // factor, factor)
+    if mode == "max":
+        return np.fmax.reduce(np.fmax.reduce(blocks, axis=3), axis=1)
+    finite = np.isfinite(blocks)
+    sums = np.where(finite, blocks, 0).sum(axis=(1, 3))
+    counts = finite.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
@@ -0,0 +1,271 @@
+"""表面时间序列动画的离屏导出模块
+
+顶点颜色在工作进程池中分批计算, 渲染在GUI线程中通过离屏帧缓冲(`renderToArray`)完成
+(OpenGL上下文不能离开GUI线程), 编码在写入线程中进行, mp4由ffmpeg子进程编码.
+三个阶段通过有界队列组成流水线, 导出期间界面保持响应.
+
+渲染使用与表面视图共享几何数据的独立离屏视图, 始终渲染完整网格,
+不受界面上的交互, 简化网格(LOD)和播放的影响.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pyqtgraph.opengl as gl
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+
+from .surface_cache import SharedMeshData
+
+BATCH_FRAMES = 8
+"""每个颜色计算任务包含的帧数"""
+MAX_PENDING_BATCHES = 4
+"""同时提交到工作进程的最大批数"""
+MAX_QUEUED_FRAMES = 16
+"""等待编码的已渲染帧的最大数量"""
+
+_ENGINE = None
+
+
+def _init_worker(engine):
+    global _ENGINE
+    _ENGINE = engine
+
+
+def _render_batch(values):
+    """在工作进程中计算一批帧的顶点颜色"""
+    out = np.empty((len(values), _ENGINE.n_vertices, 4), dtype=np.float32)
+    for i, frame_values in enumerate(values):
+        _ENGINE.render(frame_values, out=out[i])
+    return out
+
+
+def _open_writer(path: str, fps: float):
+    try:
+        import imageio
+    except ImportError:
+        raise ImportError(
+            "Movie export requires imageio, "
+            "install it with `pip install imageio imageio-ffmpeg`"
+        )
+    if path.lower().endswith(".gif"):
+        # GIF的帧间隔以毫秒为单位
+        return imageio.get_writer(path, mode="I", duration=1000 / fps, loop=0)
+    return imageio.get_writer(path, fps=fps, quality=8)
+
+
+def _to_rgb(image: np.ndarray, size):
+    """将`renderToArray`得到的BGRA图像转换为(高, 宽, 3)的RGB图像"""
+    w, h = size
+    if image.shape[:2] == (w, h) and w != h:
+        # 旧版本pyqtgraph返回(宽, 高, 4)的数组
+        image = image.transpose(1, 0, 2)
+    return np.ascontiguousarray(image[..., [2, 1, 0]])
+
+
+def _offscreen_view(view, size) -> gl.GLViewWidget:
+    """创建与`view`共享几何数据, 着色器和当前相机参数的离屏视图, 始终显示完整网格"""
+    geometry = view.geometry
+    offscreen = gl.GLViewWidget()
+    # 显示但不出现在屏幕上, 以创建OpenGL上下文
+    offscreen.setAttribute(Qt.WA_DontShowOnScreen)
+    offscreen.opts = dict(view.opts)
+    offscreen.resize(*size)
+    offscreen.md = SharedMeshData(geometry.vertices, geometry.faces, geometry.normals)
+    offscreen.surface = gl.GLMeshItem(
+        meshdata=offscreen.md,
+        smooth=view.surface.opts["smooth"],
+        shader=view.surface.shader(),
+    )
+    offscreen.surface.setTransform(view.surface.transform())
+    offscreen.addItem(offscreen.surface)
+    offscreen.show()
+    return offscreen
+
+
+class MovieExporter(QObject):
+    """将表面时间序列动画离屏渲染并编码为mp4或gif
+
+    Parameters
+    ----------
+    view : AtlasSurfaceViewWidget
+        表面视图控件, 以其几何数据, 着色器和导出开始时的相机参数创建离屏视图
+    engine : VertexColorEngine
+        顶点颜色计算引擎, 会被复制到每个工作进程中
+    frame_source : Callable[[int], ArrayLike]
+        根据帧序号获取该帧脑区数值的函数
+    frames : Sequence[int]
+        要导出的帧序号
+    size : tuple[int, int]
+        输出的宽和高
+    path : str
+        输出文件路径, 格式由后缀决定
+    fps : float, optional
+        输出的帧率, by default 30
+    workers : int, optional
+        工作进程数, 默认为CPU核数
+    parent : QObject, optional
+        父对象, by default None
+
+    Attributes
+    ----------
+    view : gl.GLViewWidget
+        用于渲染的离屏视图, 可以在开始导出前向其中添加图例等图形项
+    """
+
+    # 导出进度: 已编码帧数, 总帧数
+    progressChanged = pyqtSignal(int, int)
+    # 导出完成, 参数为输出文件路径
+    finished = pyqtSignal(str)
+    # 导出失败, 参数为错误信息
+    failed = pyqtSignal(str)
+
+    def __init__(
+        self,
+        view,
+        engine,
+        frame_source,
+        frames,
+        size,
+        path: str,
+        fps: float = 30,
+        workers: "int | None" = None,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.view = _offscreen_view(view, size)
+        self.engine = engine
+        self.frame_source = frame_source
+        self.frames = list(frames)
+        self.size = tuple(int(s) for s in size)
+        self.path = path
+        self.fps = fps
+        self.workers = workers or os.cpu_count() or 1
+
+        self._batches = [
+            self.frames[i : i + BATCH_FRAMES]
+            for i in range(0, len(self.frames), BATCH_FRAMES)
+        ]
+        self._pending = []
+        self._next_batch = 0
+        self._colors = None
+        self._color_index = 0
+        self._queue: "queue.Queue[np.ndarray | None]" = queue.Queue(MAX_QUEUED_FRAMES)
+        self._cancelled = False
+        self._done = False
+        self._error = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._step)
+
+    def start(self):
+        """开始导出, 立即返回"""
+        try:
+            writer = _open_writer(self.path, self.fps)
+        except Exception as e:
+            self.view.close()
+            self.view.deleteLater()
+            self.failed.emit(str(e))
+            return
+        # spawn启动的工作进程不会继承主进程中的Qt和OpenGL状态
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.engine,),
+        )
+        self._writer_thread = threading.Thread(
+            target=self._write, args=(writer,), daemon=True
+        )
+        self._writer_thread.start()
+        self._submit()
+        self._timer.start()
+
+    def cancel(self):
+        """取消导出, 已写入的部分会被保留"""
+        self._cancelled = True
+        self._finish()
+
+    def _submit(self):
+        while (
+            len(self._pending) < MAX_PENDING_BATCHES
+            and self._next_batch < len(self._batches)
+        ):
+            batch = self._batches[self._next_batch]
+            values = np.stack([np.asarray(self.frame_source(f)) for f in batch])
+            self._pending.append(self._executor.submit(_render_batch, values))
+            self._next_batch += 1
+
+    def _step(self):
+        """在GUI线程中渲染一帧, 每次调用只渲染一帧以保持界面响应"""
+        if self._error is not None:
+            self._finish()
+            return
+        if self._colors is None:
+            if not self._pending:
+                self._finish()
+                return
+            if not self._pending[0].done():
+                return
+            try:
+                self._colors = self._pending.pop(0).result()
+            except Exception as e:
+                self._error = e
+                self._finish()
+                return
+            self._color_index = 0
+            self._submit()
+        if self._queue.full():
+            # 编码跟不上渲染, 等待写入线程
+            return
+
+        self.view.md.setVertexColors(self._colors[self._color_index])
+        self.view.surface.vertexes = None
+        image = self.view.renderToArray(self.size)
+        self._queue.put(_to_rgb(image, self.size))
+
+        self._color_index += 1
+        if self._color_index >= len(self._colors):
+            self._colors = None
+
+    def _finish(self):
+        if self._done or not hasattr(self, "_executor"):
+            return
+        self._done = True
+        self._timer.stop()
+        self._queue.put(None)
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+        self.view.close()
+        self.view.deleteLater()
+
+    def _write(self, writer):
+        written = 0
+        while True:
+            image = self._queue.get()
+            if image is None:
+                break
+            # 取消或出错后继续取出队列中的帧, 以免GUI线程阻塞
+            if self._cancelled or self._error is not None:
+                continue
+            try:
+                writer.append_data(image)
+            except Exception as e:
+                self._error = e
+                continue
+            written += 1
+            self.progressChanged.emit(written, len(self.frames))
+        try:
+            writer.close()
+        except Exception as e:
+            self._error = self._error or e
+
+        if self._error is not None:
+            self.failed.emit(str(self._error))
+        elif not self._cancelled:
+            self.finished.emit(self.path)
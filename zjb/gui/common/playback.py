@@ -0,0 +1,137 @@
+"""时间序列动画的播放调度模块
+"""
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+
+
+class PlaybackScheduler(QObject):
+    """按目标帧率驱动时间序列动画的播放调度器
+
+    当前帧由墙钟时间和播放速率(每秒墙钟时间对应的仿真时间)决定, 与渲染耗时无关,
+    因此播放不会在负载较高时漂移. 当渲染跟不上目标帧率时, 调度器会直接跳到墙钟时间
+    对应的帧, 并统计被丢弃的帧数.
+
+    Parameters
+    ----------
+    n_frames : int
+        总帧数(采样点数)
+    sample_period : float
+        相邻两帧之间的仿真时间
+    target_fps : float, optional
+        目标帧率, by default 30
+    parent : QObject, optional
+        父对象, by default None
+    """
+
+    # 请求渲染指定帧
+    frameRequested = pyqtSignal(int)
+    # 播放统计信息: 实际帧率, 累计丢弃帧数
+    statsChanged = pyqtSignal(float, int)
+    # 播放到最后一帧
+    finished = pyqtSignal()
+
+    def __init__(self, n_frames: int, sample_period: float, target_fps=30, parent=None):
+        super().__init__(parent)
+        self.n_frames = n_frames
+        self.sample_period = sample_period or 1.0
+        self._rate = 0.0
+        self._frame = 0
+        self._anchor_frame = 0.0
+        self._anchor_time = 0.0
+        self._last_tick = None
+        self._render_times = deque(maxlen=30)
+        self._frame_times = deque(maxlen=60)
+        self._skipped = 0
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self.setTargetFps(target_fps)
+
+    def targetFps(self) -> float:
+        return self._target_fps
+
+    def setTargetFps(self, fps: float):
+        """设置目标帧率"""
+        self._target_fps = max(float(fps), 1.0)
+        self._timer.setInterval(int(round(1000 / self._target_fps)))
+
+    def rate(self) -> float:
+        return self._rate
+
+    def setRate(self, rate: float):
+        """设置播放速率, 即每秒墙钟时间播放的仿真时间(单位与采样周期一致)"""
+        self._reanchor()
+        self._rate = max(float(rate), 0.0)
+
+    def frameStep(self) -> int:
+        """以目标帧率播放时相邻两次渲染之间的帧间隔"""
+        return max(int(round(self._rate / self.sample_period / self._target_fps)), 1)
+
+    def frame(self) -> int:
+        return self._frame
+
+    def seek(self, frame: int):
+        """跳转到指定帧"""
+        self._frame = min(max(int(frame), 0), self.n_frames - 1)
+        self._reanchor()
+
+    def isActive(self) -> bool:
+        return self._timer.isActive()
+
+    def start(self):
+        self._reanchor()
+        self._last_tick = None
+        self._frame_times.clear()
+        self._skipped = 0
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def renderTime(self) -> float:
+        """最近若干帧的平均渲染耗时(秒)"""
+        if not self._render_times:
+            return 0.0
+        return sum(self._render_times) / len(self._render_times)
+
+    def achievedFps(self) -> float:
+        """最近若干帧的实际帧率"""
+        if len(self._frame_times) < 2:
+            return 0.0
+        elapsed = self._frame_times[-1] - self._frame_times[0]
+        return (len(self._frame_times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def skippedFrames(self) -> int:
+        """本次播放累计丢弃的帧数"""
+        return self._skipped
+
+    def _reanchor(self):
+        self._anchor_frame = float(self._frame)
+        self._anchor_time = time.perf_counter()
+
+    def _tick(self):
+        now = time.perf_counter()
+        interval = 1 / self._target_fps
+        if self._last_tick is not None:
+            # 两次调度之间错过的渲染时机即为丢弃的帧
+            self._skipped += max(int((now - self._last_tick) / interval - 0.5), 0)
+        self._last_tick = now
+
+        position = (
+            self._anchor_frame
+            + (now - self._anchor_time) * self._rate / self.sample_period
+        )
+        frame = min(int(position), self.n_frames - 1)
+        if frame != self._frame:
+            self._frame = frame
+            self.frameRequested.emit(frame)
+            self._render_times.append(time.perf_counter() - now)
+            self._frame_times.append(now)
+            self.statsChanged.emit(self.achievedFps(), self._skipped)
+
+        if frame >= self.n_frames - 1:
+            self.stop()
+            self.finished.emit()
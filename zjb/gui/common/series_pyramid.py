@@ -0,0 +1,246 @@
+"""时间序列的多分辨率(最小/最大值)金字塔, 为时间序列图提供细节层次(LOD)显示
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .chunked_series import get_series_data, iter_blocks
+
+PYRAMID_BYTES = 512 * 1024**2
+"""每个金字塔保存的最小/最大值数组的内存上限(bytes)"""
+BUILD_BLOCK_BYTES = 64 * 1024**2
+"""构建金字塔时每次读入的数据块大小(bytes)"""
+CACHE_SIZE = 8
+"""缓存的金字塔的最大个数"""
+
+
+class MinMaxPyramid:
+    """时间序列的最小/最大值金字塔
+
+    第0层为原始数据, 第k层将原始数据按`factor**k`个采样点分箱, 每个箱保存箱内的最小值和最大值.
+    绘图时每个箱输出两个点, 因此降采样后尖峰不会被混叠掉.
+
+    金字塔按块流式构建, 不要求原始数据全部在内存中. 为了限制内存, 只保存总大小不超过
+    `max_bytes`的层; 需要比已保存的最精细层更精细的层级时, 从原始数据中读取可见窗口即时计算.
+
+    Parameters
+    ----------
+    data : ArrayLike
+        (时间, 空间)的时间序列数据
+    time : ArrayLike
+        与数据第一维对应的时间数组
+    factor : int, optional
+        相邻两层之间的分箱倍数, by default 4
+    min_bins : int, optional
+        最粗一层至少保留的箱数, by default 1024
+    max_bytes : int, optional
+        保存的各层最小/最大值数组的内存上限, by default :py:data:`PYRAMID_BYTES`
+    """
+
+    def __init__(
+        self,
+        data,
+        time,
+        factor: int = 4,
+        min_bins: int = 1024,
+        max_bytes: int = PYRAMID_BYTES,
+    ):
+        self.data = data
+        self.time = np.asarray(time)
+        self.factor = factor
+
+        self.bin_sizes = [1]
+        self._mins = [None]
+        self._maxs = [None]
+
+        n = data.shape[0]
+        # 每个箱的最小/最大值占用的字节数, 各层总大小约为第一个保存层的 factor/(factor-1) 倍
+        bin_bytes = 2 * int(np.prod(data.shape[1:])) * np.dtype(data.dtype).itemsize
+        size = factor
+        while -(-n // size) * bin_bytes * factor / (factor - 1) > max_bytes:
+            size *= factor
+        if -(-n // size) < min_bins:
+            return
+
+        lo, hi = _pool_blocks(data, size)
+        while True:
+            self.bin_sizes.append(size)
+            self._mins.append(lo)
+            self._maxs.append(hi)
+            size *= factor
+            if -(-n // size) < min_bins:
+                break
+            lo, hi = _pool(lo, hi, factor)
+
+    @property
+    def levels(self):
+        """金字塔的层数(包括原始数据)"""
+        return len(self.bin_sizes)
+
+    def level_for(self, n_samples: int, max_points: int):
+        """选择能以不超过`max_points`个点显示`n_samples`个采样点的最精细层
+
+        没有保存的层级时总是返回0, 由:py:meth:`window`即时分箱
+        """
+        if n_samples <= max_points:
+            return 0
+        for level in range(1, self.levels):
+            if 2 * n_samples / self.bin_sizes[level] <= max_points:
+                return level
+        return self.levels - 1
+
+    def window(self, t0: float, t1: float, columns, max_points: int):
+        """获取时间范围[t0, t1]内被选中列的显示数据
+
+        Parameters
+        ----------
+        t0, t1 : float
+            可见的时间范围
+        columns : list[int]
+            被选中的列(脑区)
+        max_points : int
+            每条曲线期望的最大点数
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            (点数,)的时间数组与(点数, 列数)的数值数组
+        """
+        n = len(self.time)
+        i0 = max(int(np.searchsorted(self.time, t0)) - 1, 0)
+        i1 = min(int(np.searchsorted(self.time, t1)) + 1, n)
+        if i1 <= i0:
+            i0, i1 = 0, n
+
+        if i1 - i0 <= max_points:
+            return self.time[i0:i1], np.asarray(self.data[i0:i1, columns])
+
+        size = self._ideal_bin_size(i1 - i0, max_points)
+        if self.levels == 1 or size < self.bin_sizes[1]:
+            # 没有保存的层级(数据较短), 或所需层级比保存的最精细层更精细,
+            # 从原始数据的可见窗口即时计算
+            i0 = i0 // size * size
+            raw = np.asarray(self.data[i0:i1, columns])
+            lo, hi = _pool(raw, raw, size)
+            b0, b1 = i0 // size, i0 // size + len(lo)
+        else:
+            size = self.bin_sizes[self.level_for(i1 - i0, max_points)]
+            b0, b1 = i0 // size, -(-i1 // size)
+            lo = self._mins[level][b0:b1, columns]
+            hi = self._maxs[level][b0:b1, columns]
+
+        starts = np.arange(b0, b1) * size
+        keys = np.empty(2 * len(starts), dtype=self.time.dtype)
+        keys[0::2] = self.time[starts]
+        keys[1::2] = self.time[np.minimum(starts + size // 2, n - 1)]
+        values = np.empty((2 * len(starts), lo.shape[1]), dtype=lo.dtype)
+        values[0::2] = lo
+        values[1::2] = hi
+        return keys, values
+
+    def _ideal_bin_size(self, n_samples: int, max_points: int):
+        size = self.factor
+        while 2 * n_samples / size > max_points:
+            size *= self.factor
+        return size
+
+    def ptp(self):
+        """每一列的峰峰值, 由最粗一层直接得到, 无需扫描原始数据"""
+        if self.levels == 1:
+            lo, hi = _pool_blocks(self.data, max(self.data.shape[0], 1))
+            return hi.max(axis=0) - lo.min(axis=0)
+        return self._maxs[-1].max(axis=0) - self._mins[-1].min(axis=0)
+
+
+def _pool_blocks(data, size: int):
+    """按块流式读取原始数据并以`size`个采样点分箱"""
+    row_bytes = int(np.prod(data.shape[1:])) * np.dtype(data.dtype).itemsize
+    rows = max(BUILD_BLOCK_BYTES // max(row_bytes, 1) // size, 1) * size
+    mins, maxs = [], []
+    for _, block in iter_blocks(data, rows):
+        lo, hi = _pool(block, block, size)
+        mins.append(lo)
+        maxs.append(hi)
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def _pool(lo, hi, factor: int):
+    """将(时间, 空间)的最小/最大值数组按`factor`分箱, 末尾不足一箱的部分单独成箱"""
+    n = lo.shape[0]
+    full = n // factor * factor
+    new_lo = np.asarray(lo[:full]).reshape(-1, factor, *lo.shape[1:]).min(axis=1)
+    new_hi = np.asarray(hi[:full]).reshape(-1, factor, *hi.shape[1:]).max(axis=1)
+    if full < n:
+        new_lo = np.concatenate([new_lo, np.asarray(lo[full:]).min(axis=0)[None]])
+        new_hi = np.concatenate([new_hi, np.asarray(hi[full:]).max(axis=0)[None]])
+    return new_lo, new_hi
+
+
+class _SeriesPyramidCache(QObject):
+    """时间序列金字塔缓存, 以时间序列的gid为键, 最多保存:py:data:`CACHE_SIZE`个
+
+    构建金字塔需要扫描整个时间序列, 对于很大的内存映射文件耗时较长, 因此在后台线程中构建.
+    """
+
+    # 金字塔构建完成信号, 参数为时间序列的gid
+    pyramidReady = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._cache: "OrderedDict[str, MinMaxPyramid]" = OrderedDict()
+        self._pending: set[str] = set()
+        # 构建过程中被移除的键, 构建完成后不再缓存
+        self._discarded: set[str] = set()
+        self._lock = threading.Lock()
+
+    def get(self, time_series) -> "MinMaxPyramid | None":
+        """获取时间序列对应的金字塔
+
+        如果金字塔尚未构建, 则在后台线程中开始构建并返回None,
+        构建完成后发出:py:attr:`pyramidReady`信号.
+        """
+        key = time_series._gid.str
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+
+        threading.Thread(
+            target=self._build,
+            args=(key, get_series_data(time_series), time_series.time),
+            daemon=True,
+        ).start()
+        return None
+
+    def _build(self, key: str, data, time):
+        try:
+            pyramid = MinMaxPyramid(data, time)
+        except Exception:
+            with self._lock:
+                self._pending.discard(key)
+                self._discarded.discard(key)
+            raise
+        with self._lock:
+            self._pending.discard(key)
+            if key in self._discarded:
+                self._discarded.discard(key)
+                return
+            self._cache[key] = pyramid
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        self.pyramidReady.emit(key)
+
+    def discard(self, key: str):
+        """移除缓存的金字塔, 正在构建的金字塔完成后也不会被缓存"""
+        with self._lock:
+            self._cache.pop(key, None)
+            if key in self._pending:
+                self._discarded.add(key)
+
+
+SERIES_PYRAMIDS = _SeriesPyramidCache()
@@ -0,0 +1,145 @@
+"""时间序列统计量缓存模块
+
+每个时间序列(按gid)的逐脑区统计量只在后台线程中计算一次, 由所有展示该时间序列的页面和控件共享.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .chunked_series import get_series_data, iter_blocks
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+"""缓存的百分位数"""
+PERCENTILE_SAMPLES = 100000
+"""计算百分位数时最多使用的时间点数, 更长的时间序列等间隔抽样"""
+PERCENTILE_BYTES = 256 * 1024**2
+"""计算百分位数时最多读入的数据量(bytes), 每帧很大的时间序列(如顶点级时间序列)相应减少抽样的时间点数"""
+BLOCK_BYTES = 64 * 1024**2
+"""流式计算时每次读入的数据块大小(bytes)"""
+CACHE_SIZE = 32
+"""缓存的时间序列统计量的最大个数"""
+
+
+class SeriesStatistics:
+    """时间序列的逐脑区统计量
+
+    Attributes
+    ----------
+    min, max, ptp, mean : np.ndarray
+        每个脑区的最小值, 最大值, 峰峰值和均值
+    percentiles : dict[int, np.ndarray]
+        每个脑区的百分位数, 键为:py:data:`PERCENTILES`中的百分位
+    """
+
+    def __init__(self, data):
+        # 按块流式计算, 数据不必全部在内存中
+        n = data.shape[0]
+        if n == 0:
+            # 还没有数据(如刚开始的实时时间序列), 所有统计量为0
+            zeros = np.zeros(data.shape[1:])
+            self.min, self.max, self.ptp, self.mean = zeros, zeros, zeros, zeros
+            self.percentiles = {q: zeros for q in PERCENTILES}
+            return
+        row_bytes = int(np.prod(data.shape[1:])) * np.dtype(data.dtype).itemsize
+        rows = max(BLOCK_BYTES // max(row_bytes, 1), 1)
+        total = None
+        for _, block in iter_blocks(data, rows):
+            if total is None:
+                self.min = block.min(axis=0)
+                self.max = block.max(axis=0)
+                total = block.sum(axis=0, dtype=np.float64)
+            else:
+                np.minimum(self.min, block.min(axis=0), out=self.min)
+                np.maximum(self.max, block.max(axis=0), out=self.max)
+                total += block.sum(axis=0, dtype=np.float64)
+        self.ptp = self.max - self.min
+        self.mean = total / n
+
+        # 百分位数在等间隔抽样的时间点上计算, 直接从数据源读取以免占用块缓存
+        step = max(n // PERCENTILE_SAMPLES, -(-n * row_bytes // PERCENTILE_BYTES), 1)
+        samples = np.asarray(getattr(data, "source", data)[::step])
+        self.percentiles = dict(
+            zip(PERCENTILES, np.percentile(samples, PERCENTILES, axis=0))
+        )
+
+    @property
+    def global_min(self) -> float:
+        return float(self.min.min())
+
+    @property
+    def global_max(self) -> float:
+        return float(self.max.max())
+
+    def percentile_range(self, low: int = 1, high: int = 99):
+        """所有脑区的百分位范围, 可用于对异常值稳健的颜色范围"""
+        return (
+            float(self.percentiles[low].min()),
+            float(self.percentiles[high].max()),
+        )
+
+
+class _SeriesStatisticsCache(QObject):
+    """时间序列统计量缓存, 以时间序列的gid为键, 最多保存:py:data:`CACHE_SIZE`个"""
+
+    # 统计量计算完成信号, 参数为时间序列的gid
+    statisticsReady = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._cache: "OrderedDict[str, SeriesStatistics]" = OrderedDict()
+        self._pending: set[str] = set()
+        # 计算过程中被移除的键, 计算完成后不再缓存
+        self._discarded: set[str] = set()
+        self._lock = threading.Lock()
+
+    def get(self, time_series) -> "SeriesStatistics | None":
+        """获取时间序列的统计量
+
+        如果统计量尚未计算, 则在后台线程中开始计算并返回None,
+        计算完成后发出:py:attr:`statisticsReady`信号.
+        """
+        key = time_series._gid.str
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+
+        threading.Thread(
+            target=self._compute,
+            args=(key, get_series_data(time_series)),
+            daemon=True,
+        ).start()
+        return None
+
+    def _compute(self, key: str, data):
+        try:
+            statistics = SeriesStatistics(data)
+        except Exception:
+            with self._lock:
+                self._pending.discard(key)
+                self._discarded.discard(key)
+            raise
+        with self._lock:
+            self._pending.discard(key)
+            if key in self._discarded:
+                self._discarded.discard(key)
+                return
+            self._cache[key] = statistics
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        self.statisticsReady.emit(key)
+
+    def discard(self, key: str):
+        """移除缓存的统计量, 正在计算的统计量完成后也不会被缓存"""
+        with self._lock:
+            self._cache.pop(key, None)
+            if key in self._pending:
+                self._discarded.add(key)
+
+
+SERIES_STATISTICS = _SeriesStatisticsCache()
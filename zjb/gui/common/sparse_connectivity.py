@@ -0,0 +1,122 @@
+"""稀疏连接矩阵的支持
+
+精细图谱(上千个脑区)或顶点级的连接矩阵通常经过阈值处理后只保留少量的边,
+以scipy.sparse(CSR/COO等)格式保存. 连接可视化通过本模块提取子矩阵, 计算颜色范围和选边, 不会把整个
+矩阵转换为稠密数组; 只有需要显示的子矩阵才转换为稠密数组, 超过:py:data:`MAX_IMAGE_SIZE`
+时先按块池化缩小, 池化方式与热图金字塔(:py:mod:`.heatmap_pyramid`)相同.
+
+scipy是可选依赖, 没有安装scipy时所有矩阵都视为稠密矩阵.
+"""
+import numpy as np
+
+from .heatmap_pyramid import POOLING_MODES
+
+MAX_IMAGE_SIZE = 2048
+"""稀疏子矩阵转换为稠密图像时的最大边长, 超过时按块池化缩小"""
+
+
+def is_sparse(matrix) -> bool:
+    """矩阵是否为scipy.sparse的稀疏矩阵或稀疏数组"""
+    try:
+        from scipy import sparse
+    except ImportError:
+        return False
+    return sparse.issparse(matrix)
+
+
+def as_csr(matrix):
+    """转换为CSR格式并合并重复的元素, 不修改传入的矩阵, 已经是规范的CSR格式时不复制"""
+    csr = matrix.tocsr()
+    if csr.has_canonical_format:
+        return csr
+    if csr is matrix:
+        csr = csr.copy()
+    csr.sum_duplicates()
+    return csr
+
+
+def submatrix(matrix, rows, columns=None):
+    """提取子矩阵, 稀疏矩阵的结果仍为CSR格式
+
+    Parameters
+    ----------
+    matrix : ArrayLike | scipy.sparse
+        连接矩阵
+    rows : ArrayLike
+        行(脑区)编号
+    columns : ArrayLike, optional
+        列(脑区)编号, 默认与行相同
+    """
+    rows = np.asarray(rows, dtype=np.intp).ravel()
+    columns = rows if columns is None else np.asarray(columns, dtype=np.intp).ravel()
+    if is_sparse(matrix):
+        return as_csr(matrix)[rows][:, columns]
+    return np.asarray(matrix)[np.ix_(rows, columns)]
+
+
+def value_range(matrix) -> "tuple[float, float]":
+    """矩阵中有限值的范围, 稀疏矩阵只遍历存储的元素(有未存储的元素时包含0)"""
+    if is_sparse(matrix):
+        values = as_csr(matrix).data
+        if matrix.nnz < matrix.shape[0] * matrix.shape[1]:
+            values = np.append(values, 0.0)
+    else:
+        values = np.asarray(matrix).ravel()
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return 0.0, 0.0
+    return float(values.min()), float(values.max())
+
+
+def to_image(
+    matrix, max_size: int = MAX_IMAGE_SIZE, mode: str = "max"
+) -> np.ndarray:
+    """转换为用于显示的稠密图像
+
+    稀疏矩阵的边长超过`max_size`时, 先按块池化缩小到不超过`max_size`, 只分配缩小后的稠密数组.
+    未存储的元素按0参与池化, 与稠密矩阵在:py:class:`.heatmap_pyramid.HeatmapPyramid`中的结果一致.
+
+    Parameters
+    ----------
+    matrix : ArrayLike | scipy.sparse
+        连接矩阵
+    max_size : int, optional
+        图像的最大边长, by default :py:data:`MAX_IMAGE_SIZE`
+    mode : str, optional
+        池化方式, :py:data:`.heatmap_pyramid.POOLING_MODES`之一, by default "max"
+    """
+    if mode not in POOLING_MODES:
+        raise ValueError(f"Unknown pooling mode '{mode}'")
+    if not is_sparse(matrix):
+        return np.asarray(matrix, dtype=float)
+    from scipy import sparse
+
+    matrix = as_csr(matrix)
+    factors = [-(-size // max_size) for size in matrix.shape]
+    if max(factors) == 1:
+        return matrix.toarray().astype(float, copy=False)
+
+    bins = [np.arange(size) // factor for size, factor in zip(matrix.shape, factors)]
+    counts = [np.bincount(b) for b in bins]
+    if mode == "mean":
+        pooling = [
+            sparse.csr_matrix(
+                (1.0 / c[b], (b, np.arange(len(b)))), shape=(len(c), len(b))
+            )
+            for b, c in zip(bins, counts)
+        ]
+        matrix = pooling[0] @ matrix @ pooling[1].T
+        return matrix.toarray().astype(float, copy=False)
+
+    coo = matrix.tocoo()
+    blocks = (bins[0][coo.row], bins[1][coo.col])
+    shape = (len(counts[0]), len(counts[1]))
+    image = np.full(shape, -np.inf)
+    np.fmax.at(image, blocks, coo.data)
+    stored = np.zeros(shape, dtype=np.intp)
+    np.add.at(stored, blocks, 1)
+    # 块中有未存储的元素时, 最大值不小于0; 整块都是NaN时结果为NaN
+    sparse_blocks = stored < np.outer(counts[0], counts[1])
+    image[sparse_blocks] = np.fmax(image[sparse_blocks], 0.0)
+    image[np.isneginf(image)] = np.nan
+    return image
@@ -0,0 +1,154 @@
+"""表面三角形的包围盒层次结构(BVH), 用于快速拾取鼠标下的脑区
+
+三角形按重心的Morton码排序后, 每`LEAF_SIZE`个相邻三角形组成一个叶节点, 再自底向上
+两两合并为一棵隐式的完全二叉树. 查询时逐层对整层的候选节点做向量化的射线-包围盒测试,
+最后只对命中叶节点中的三角形做射线-三角形测试, 几十万个三角形的网格也能在1毫秒内完成.
+"""
+import numpy as np
+
+LEAF_SIZE = 16
+"""每个叶节点包含的三角形数"""
+
+
+class RayHit:
+    """射线与网格的交点
+
+    Attributes
+    ----------
+    face : int
+        命中的三角形序号
+    distance : float
+        交点沿射线方向的参数
+    barycentric : np.ndarray
+        交点在三角形中的重心坐标
+    """
+
+    def __init__(self, face: int, distance: float, barycentric: np.ndarray):
+        self.face = face
+        self.distance = distance
+        self.barycentric = barycentric
+
+
+class TriangleBVH:
+    """表面三角形的包围盒层次结构
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (顶点, 3)的顶点坐标
+    faces : np.ndarray
+        (面, 3)的面索引
+    """
+
+    def __init__(self, vertices: np.ndarray, faces: np.ndarray):
+        self.faces = faces
+        triangles = np.asarray(vertices, dtype=np.float32)[faces]
+        self.order = np.argsort(_morton_codes(triangles.mean(axis=1)), kind="stable")
+        triangles = triangles[self.order]
+        self._v0 = triangles[:, 0]
+        self._e1 = triangles[:, 1] - self._v0
+        self._e2 = triangles[:, 2] - self._v0
+
+        n_faces = len(triangles)
+        n_leaves = max(-(-n_faces // LEAF_SIZE), 1)
+        self.depth = int(np.ceil(np.log2(n_leaves))) if n_leaves > 1 else 0
+        size = 2**self.depth
+
+        # 叶节点包围盒, 空节点的包围盒为空集(lo=inf, hi=-inf)
+        lo = np.full((size * LEAF_SIZE, 3), np.inf, dtype=np.float32)
+        hi = np.full((size * LEAF_SIZE, 3), -np.inf, dtype=np.float32)
+        lo[:n_faces] = triangles.min(axis=1)
+        hi[:n_faces] = triangles.max(axis=1)
+        lo = lo.reshape(size, LEAF_SIZE, 3).min(axis=1)
+        hi = hi.reshape(size, LEAF_SIZE, 3).max(axis=1)
+
+        # 自底向上合并, levels[0]为根节点
+        self._levels = [(lo, hi)]
+        while len(lo) > 1:
+            lo = np.minimum(lo[0::2], lo[1::2])
+            hi = np.maximum(hi[0::2], hi[1::2])
+            self._levels.insert(0, (lo, hi))
+
+    def intersect(self, origin, direction) -> "RayHit | None":
+        """求射线与网格最近的交点
+
+        Parameters
+        ----------
+        origin : ArrayLike
+            射线起点
+        direction : ArrayLike
+            射线方向
+
+        Returns
+        -------
+        RayHit | None
+            最近的交点, 没有交点时为None
+        """
+        origin = np.asarray(origin, dtype=np.float32)
+        direction = np.asarray(direction, dtype=np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv = 1 / direction
+            nodes = np.zeros(1, dtype=np.intp)
+            for level, (lo, hi) in enumerate(self._levels):
+                t1 = (lo[nodes] - origin) * inv
+                t2 = (hi[nodes] - origin) * inv
+                t_near = np.minimum(t1, t2).max(axis=1)
+                t_far = np.maximum(t1, t2).min(axis=1)
+                # 填充的空节点(lo > hi)不参与测试
+                hit = (t_far >= np.maximum(t_near, 0)) & (lo[nodes, 0] <= hi[nodes, 0])
+                nodes = nodes[hit]
+                if not len(nodes):
+                    return None
+                if level < self.depth:
+                    nodes = np.concatenate([2 * nodes, 2 * nodes + 1])
+
+        candidates = (nodes[:, None] * LEAF_SIZE + np.arange(LEAF_SIZE)).ravel()
+        candidates = candidates[candidates < len(self._v0)]
+        return self._intersect_triangles(candidates, origin, direction)
+
+    def _intersect_triangles(self, candidates, origin, direction):
+        """Möller–Trumbore射线-三角形测试"""
+        e1, e2 = self._e1[candidates], self._e2[candidates]
+        p = np.cross(direction, e2)
+        det = np.einsum("ij,ij->i", e1, p)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.where(valid, 1 / np.where(valid, det, 1), 0)
+        s = origin - self._v0[candidates]
+        u = np.einsum("ij,ij->i", s, p) * inv_det
+        q = np.cross(s, e1)
+        v = (q @ direction) * inv_det
+        t = np.einsum("ij,ij->i", e2, q) * inv_det
+        hit = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+        if not hit.any():
+            return None
+        index = np.flatnonzero(hit)[np.argmin(t[hit])]
+        return RayHit(
+            int(self.order[candidates[index]]),
+            float(t[index]),
+            np.array([1 - u[index] - v[index], u[index], v[index]]),
+        )
+
+    def nearest_vertex(self, hit: RayHit) -> int:
+        """交点所在三角形中离交点最近的顶点"""
+        return int(self.faces[hit.face, np.argmax(hit.barycentric)])
+
+
+def _morton_codes(points: np.ndarray):
+    """三维点的30位Morton码, 用于按空间局部性排序"""
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-12)
+    q = ((points - lo) / extent * 1023).astype(np.uint64)
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for k in range(3):
+        codes |= _spread_bits(q[:, k]) << np.uint64(2 - k)
+    return codes
+
+
+def _spread_bits(x: np.ndarray):
+    """把10位整数的每一位之间插入两个0"""
+    x = x & np.uint64(0x3FF)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x30000FF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x300F00F)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x30C30C3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x9249249)
+    return x
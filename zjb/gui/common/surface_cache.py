@@ -0,0 +1,184 @@
+"""进程级共享的表面几何数据缓存
+
+同一个表面及脑区映射(按gid)的顶点, 面, 法向量和顶点脑区编号只计算一次, 由所有页面和
+标签页的表面视图共享, 打开同一个被试的更多表面页面几乎不占用额外的内存和时间.
+法向量等预处理数据还保存在磁盘缓存中, 见:py:mod:`.surface_disk_cache`.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyqtgraph.opengl as gl
+
+from zjb.main.api import Surface, SurfaceRegionMapping
+
+from .mesh_lod import LOD_VERTICES, MeshLOD, decimate
+from .spatial_index import TriangleBVH
+from .surface_disk_cache import cached_surface_data
+
+
+class SurfaceGeometry:
+    """表面的几何数据, 所有数组都是只读的, 可以被多个MeshData共享
+
+    Attributes
+    ----------
+    vertices : np.ndarray
+        (顶点, 3)的float32顶点坐标
+    faces : np.ndarray
+        (面, 3)的uint32面索引
+    normals : np.ndarray
+        (顶点, 3)的float32顶点法向量
+    labels : np.ndarray
+        (顶点,)的顶点所属脑区编号
+    centroids : np.ndarray
+        (脑区, 3)的脑区中心, 没有顶点的脑区为NaN
+    adjacency : np.ndarray
+        (邻接对, 2)的相邻脑区编号对
+    boundary_edges : np.ndarray
+        (边, 2)的脑区边界边的顶点索引
+    """
+
+    def __init__(self, vertices, faces, labels):
+        self._lods: "dict[int, MeshLOD]" = {}
+        self._lod_lock = threading.Lock()
+        self._bvh: "TriangleBVH | None" = None
+        self._bvh_lock = threading.Lock()
+        self._hemispheres = None
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.faces = np.ascontiguousarray(faces, dtype=np.uint32)
+        # 预处理数据从磁盘缓存中以内存映射的方式读取, 本身就是只读的
+        data = cached_surface_data(self.vertices, self.faces, labels)
+        self.normals = data["normals"]
+        self.labels = data["labels"]
+        self.centroids = data["centroids"]
+        self.adjacency = data["adjacency"]
+        self.boundary_edges = data["boundary_edges"]
+        for array in (self.vertices, self.faces):
+            array.flags.writeable = False
+
+    @property
+    def n_vertices(self):
+        return len(self.vertices)
+
+    def lod(self, target: int = LOD_VERTICES) -> "MeshLOD | None":
+        """获取保持脑区标签的简化网格, 首次调用时计算, 之后在所有视图间共享
+
+        顶点数不超过目标顶点数两倍的网格不需要简化, 返回None.
+        """
+        if self.n_vertices <= 2 * target:
+            return None
+        with self._lod_lock:
+            if target not in self._lods:
+                self._lods[target] = decimate(
+                    self.vertices, self.faces, self.labels, target
+                )
+            return self._lods[target]
+
+    def bvh(self) -> TriangleBVH:
+        """获取三角形的包围盒层次结构, 首次调用时构建, 之后在所有视图间共享"""
+        with self._bvh_lock:
+            if self._bvh is None:
+                self._bvh = TriangleBVH(self.vertices, self.faces)
+            return self._bvh
+
+    @property
+    def bvh_ready(self) -> bool:
+        return self._bvh is not None
+
+    def pick(self, origin, direction) -> int:
+        """射线命中的脑区编号, 没有命中时为-1"""
+        hit = self.bvh().intersect(origin, direction)
+        if hit is None:
+            return -1
+        return int(self.labels[self.bvh().nearest_vertex(hit)])
+
+    def hemisphere_faces(self) -> "tuple[np.ndarray, np.ndarray]":
+        """左, 右半球的面索引, 以x坐标范围的中点为分界, 按面的重心划分
+
+        各半球的面索引引用同一组顶点, 因此可以与完整网格共享顶点, 法向量和顶点颜色.
+        """
+        if self._hemispheres is None:
+            x = self.vertices[:, 0]
+            midline = (x.min() + x.max()) / 2
+            left = x.take(self.faces).mean(axis=1) < midline
+            hemispheres = (
+                np.ascontiguousarray(self.faces[left]),
+                np.ascontiguousarray(self.faces[~left]),
+            )
+            for array in hemispheres:
+                array.flags.writeable = False
+            self._hemispheres = hemispheres
+        return self._hemispheres
+
+
+class SharedMeshData(gl.MeshData):
+    """直接引用共享数组的MeshData, 顶点法向量使用预先计算的结果而不是逐顶点重新计算
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (顶点, 3)的float32顶点坐标
+    faces : np.ndarray
+        (面, 3)的uint32面索引
+    normals : np.ndarray
+        (顶点, 3)的顶点法向量
+    """
+
+    def __init__(self, vertices, faces, normals):
+        super().__init__(vertexes=vertices, faces=faces)
+        self._shared_normals = normals
+
+    def vertexNormals(self, indexed=None):
+        if indexed is None:
+            return self._shared_normals
+        if indexed == "faces":
+            return self._shared_normals[self.faces()]
+        raise Exception("Invalid indexing mode. Accepts: None, 'faces'")
+
+
+def find_surface_data(subject):
+    """在被试的数据中查找表面及其脑区映射
+
+    Returns
+    -------
+    tuple[Surface, SurfaceRegionMapping]
+    """
+    surface = surface_region_mapping = None
+    for data in subject.data.values():
+        if isinstance(data, Surface):
+            surface = data
+        elif isinstance(data, SurfaceRegionMapping):
+            surface_region_mapping = data
+    return surface, surface_region_mapping
+
+
+_GEOMETRIES: "OrderedDict[tuple[str, str], SurfaceGeometry]" = OrderedDict()
+_GEOMETRIES_LOCK = threading.Lock()
+_GEOMETRIES_MAXSIZE = 8
+
+
+def get_surface_geometry(
+    surface: Surface, surface_region_mapping: SurfaceRegionMapping, build
+) -> SurfaceGeometry:
+    """获取表面的几何数据, 以(表面gid, 脑区映射gid)为键在进程内共享
+
+    Parameters
+    ----------
+    surface : Surface
+        表面
+    surface_region_mapping : SurfaceRegionMapping
+        脑区映射
+    build : Callable[[], SurfaceGeometry]
+        缓存中不存在时构建几何数据的函数
+    """
+    key = (surface._gid.str, surface_region_mapping._gid.str)
+    with _GEOMETRIES_LOCK:
+        if key in _GEOMETRIES:
+            _GEOMETRIES.move_to_end(key)
+            return _GEOMETRIES[key]
+    geometry = build()
+    with _GEOMETRIES_LOCK:
+        geometry = _GEOMETRIES.setdefault(key, geometry)
+        while len(_GEOMETRIES) > _GEOMETRIES_MAXSIZE:
+            _GEOMETRIES.popitem(last=False)
+    return geometry
@@ -0,0 +1,174 @@
+"""表面预处理数据的磁盘缓存
+
+表面首次显示时计算顶点法向量, 顶点脑区编号, 脑区中心, 脑区邻接关系和脑区边界边, 以表面
+顶点, 面及顶点脑区编号的内容哈希为键保存在:py:data:`SURFACE_CACHE_DIR`下, 每个数组一个
+`.npy`文件. 之后(包括重启程序后)打开同一个被试时直接以内存映射的方式读取, 不再重新计算.
+缓存目录的总大小超过
+:py:data:`SURFACE_CACHE_MAX_BYTES`时, 删除最久未使用的缓存.
+"""
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+from ..assets import ZJB_HOME
+from .mesh_lod import vertex_normals
+
+SURFACE_CACHE_DIR = ZJB_HOME / "cache" / "surfaces"
+"""表面预处理数据的缓存目录"""
+SURFACE_CACHE_VERSION = 2
+"""缓存格式版本, 预处理算法改变时递增, 旧的缓存自动失效"""
+SURFACE_CACHE_ARRAYS = (
+    "normals",
+    "labels",
+    "centroids",
+    "adjacency",
+    "boundary_edges",
+)
+"""缓存的数组名称"""
+SURFACE_CACHE_MAX_BYTES = 1024**3
+"""缓存目录的总大小上限(bytes)"""
+
+
+def content_key(vertices, faces, labels) -> str:
+    """表面内容的哈希值, 作为缓存的键"""
+    hash = hashlib.blake2b(digest_size=16)
+    hash.update(f"v{SURFACE_CACHE_VERSION}".encode())
+    for array in (vertices, faces, labels):
+        array = np.ascontiguousarray(array)
+        hash.update(f"{array.dtype.str}{array.shape}".encode())
+        hash.update(array.data)
+    return hash.hexdigest()
+
+
+def compute_surface_data(vertices, faces, labels) -> "dict[str, np.ndarray]":
+    """计算表面的预处理数据
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (顶点, 3)的顶点坐标
+    faces : np.ndarray
+        (面, 3)的面索引
+    labels : np.ndarray
+        (顶点,)的顶点所属脑区编号
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        normals: (顶点, 3)的顶点法向量;
+        labels: (顶点,)的顶点所属脑区编号;
+        centroids: (脑区, 3)的脑区中心, 没有顶点的脑区为NaN;
+        adjacency: (邻接对, 2)的相邻脑区编号对, 每对中较小的编号在前;
+        boundary_edges: (边, 2)的两端属于不同脑区的边的顶点索引
+    """
+    labels = np.ascontiguousarray(np.squeeze(labels), dtype=np.intp)
+    n_regions = int(labels.max()) + 1 if len(labels) else 0
+    assigned = labels >= 0
+
+    counts = np.bincount(labels[assigned], minlength=n_regions).astype(np.float64)
+    centroids = np.full((n_regions, 3), np.nan, dtype=np.float32)
+    nonempty = counts > 0
+    for k in range(3):
+        sums = np.bincount(
+            labels[assigned], vertices[assigned, k], minlength=n_regions
+        )
+        centroids[nonempty, k] = sums[nonempty] / counts[nonempty]
+
+    # 每条边只保留一次, 以(小索引, 大索引)表示
+    edges = np.sort(
+        np.asarray(faces, dtype=np.int64)[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1
+    )
+    n_vertices = len(vertices)
+    edges = np.unique(edges[:, 0] * n_vertices + edges[:, 1])
+    edges = np.stack([edges // n_vertices, edges % n_vertices], axis=1)
+
+    edge_labels = labels[edges]
+    boundary = edge_labels[:, 0] != edge_labels[:, 1]
+    boundary_edges = np.ascontiguousarray(edges[boundary], dtype=np.uint32)
+
+    pairs = np.sort(edge_labels[boundary], axis=1)
+    pairs = pairs[(pairs >= 0).all(axis=1)]
+    pairs = np.unique(pairs[:, 0] * max(n_regions, 1) + pairs[:, 1])
+    adjacency = np.stack(
+        [pairs // max(n_regions, 1), pairs % max(n_regions, 1)], axis=1
+    ).astype(np.intp)
+
+    return {
+        "normals": vertex_normals(vertices, faces),
+        "labels": labels,
+        "centroids": centroids,
+        "adjacency": adjacency,
+        "boundary_edges": boundary_edges,
+    }
+
+
+def load_surface_data(key: str) -> "dict[str, np.ndarray] | None":
+    """以内存映射的方式读取缓存, 缓存不存在或不完整时返回None"""
+    path = SURFACE_CACHE_DIR / key
+    try:
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r")
+            for name in SURFACE_CACHE_ARRAYS
+        }
+        # 以修改时间记录最近一次使用, 清理时先删除最久未使用的缓存
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return arrays
+
+
+def save_surface_data(key: str, arrays: "dict[str, np.ndarray]"):
+    """保存缓存, 先写入临时目录再重命名, 其他进程不会读到写了一半的缓存"""
+    path = SURFACE_CACHE_DIR / key
+    tmp = SURFACE_CACHE_DIR / f".{key}.{os.getpid()}.tmp"
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in SURFACE_CACHE_ARRAYS:
+            np.save(tmp / f"{name}.npy", arrays[name])
+        # 不完整或损坏的旧缓存会阻止重命名, 先删除以便重新写入
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+    except OSError:
+        # 缓存目录不可写, 或其他进程已经写入了同一个缓存
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    prune_surface_cache()
+
+
+def prune_surface_cache(max_bytes: int = SURFACE_CACHE_MAX_BYTES):
+    """删除最久未使用的缓存, 直到缓存目录的总大小不超过`max_bytes`"""
+    entries = []
+    try:
+        for path in SURFACE_CACHE_DIR.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                # 其他进程正在写入的临时目录
+                continue
+            size = sum(file.stat().st_size for file in path.iterdir())
+            entries.append((path.stat().st_mtime, size, path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def cached_surface_data(vertices, faces, labels) -> "dict[str, np.ndarray]":
+    """读取表面的预处理数据, 缓存中不存在时计算并写入缓存"""
+    key = content_key(vertices, faces, labels)
+    arrays = load_surface_data(key)
+    if (
+        arrays is not None
+        and len(arrays["normals"]) == len(vertices)
+        and len(arrays["labels"]) == len(vertices)
+    ):
+        return arrays
+    arrays = compute_surface_data(vertices, faces, labels)
+    save_surface_data(key, arrays)
+    for array in arrays.values():
+        array.flags.writeable = False
+    return arrays
@@ -0,0 +1,322 @@
+"""基于颜色查找表(LUT)的表面顶点颜色计算模块, 用于表面时间序列动画的播放
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .colormaps import colormap_entry
+
+LUT_SIZE = 256
+"""查找表大小, 前`LUT_SIZE - 1`项为颜色映射, 最后一项为未选中脑区的底色"""
+BACKGROUND_INDEX = LUT_SIZE - 1
+"""底色在查找表中的索引"""
+BACKGROUND_COLOR = (0.7, 0.7, 0.7, 1.0)
+"""未选中脑区的默认底色"""
+
+
+class VertexColorEngine:
+    """顶点颜色计算引擎
+
+    每一帧只在脑区层面把数值量化为uint8的颜色索引并查表, 再通过一次`take`把脑区颜色
+    填充到预分配的顶点颜色缓冲区中, 不再对每个顶点做归一化和颜色插值.
+    连续播放时通过:py:meth:`apply`只重写颜色索引发生变化的脑区的顶点.
+
+    顶点级(每个顶点一个数值)的时间序列直接把每个顶点的数值量化为颜色索引, 每帧只需一个
+    uint8的索引缓冲区.
+
+    Parameters
+    ----------
+    color_map : pg.ColorMap
+        颜色映射
+    labels : ArrayLike
+        每个顶点所属的脑区编号
+    n_regions : int
+        脑区数量
+    background : tuple, optional
+        未选中脑区的颜色, by default :py:data:`BACKGROUND_COLOR`
+    per_vertex : bool, optional
+        时间序列是否为顶点级, by default False
+    """
+
+    def __init__(
+        self,
+        color_map,
+        labels,
+        n_regions: int,
+        background=BACKGROUND_COLOR,
+        per_vertex: bool = False,
+    ):
+        self.labels = np.ascontiguousarray(np.squeeze(labels), dtype=np.intp)
+        self.regions = RegionVertexIndex(self.labels, n_regions)
+        self.per_vertex = per_vertex
+        self.region_mask = np.ones(n_regions, dtype=bool)
+        self._value_mask = self._mask_values()
+        # 查找表, 颜色范围或脑区选择每改变一次加1, 之前的颜色索引随之失效
+        self.version = 0
+        self.background = background
+        self.vmin, self.vmax = 0.0, 1.0
+        self.set_color_map(color_map)
+
+    @property
+    def n_vertices(self):
+        return len(self.labels)
+
+    def set_color_map(self, color_map):
+        """设置颜色映射, 重新生成查找表"""
+        lut = np.empty((LUT_SIZE, 4), dtype=np.float32)
+        lut[:BACKGROUND_INDEX] = colormap_entry(color_map).map(
+            np.linspace(0.0, 1.0, BACKGROUND_INDEX)
+        )
+        lut[BACKGROUND_INDEX] = self.background
+        self.lut = lut
+        self.version += 1
+
+    def set_range(self, vmin: float, vmax: float):
+        """设置颜色范围"""
+        self.vmin, self.vmax = float(vmin), float(vmax)
+        self.version += 1
+
+    def set_region_mask(self, region_mask):
+        """设置被选中脑区的掩码, 未选中的脑区显示为底色"""
+        self.region_mask = np.asarray(region_mask, dtype=bool)
+        self._value_mask = self._mask_values()
+        self.version += 1
+
+    def _mask_values(self):
+        """与每帧数值一一对应的选中掩码"""
+        if self.per_vertex:
+            return self.region_mask.take(self.labels)
+        return self.region_mask
+
+    def quantize(self, values):
+        """将脑区(顶点级时间序列为顶点)数值量化为查找表索引"""
+        scale = (BACKGROUND_INDEX - 1) / ((self.vmax - self.vmin) or 1.0)
+        indices = np.nan_to_num((np.asarray(values) - self.vmin) * scale)
+        np.clip(indices, 0, BACKGROUND_INDEX - 1, out=indices)
+        indices = indices.astype(np.uint8)
+        indices[~self._value_mask] = BACKGROUND_INDEX
+        return indices
+
+    def render(self, values, out=None):
+        """计算一帧的顶点颜色
+
+        Parameters
+        ----------
+        values : ArrayLike
+            (脑区,)或(顶点,)的当前帧数值
+        out : np.ndarray, optional
+            (顶点, 4)的float32输出缓冲区, 为None时新建
+
+        Returns
+        -------
+        np.ndarray
+            顶点颜色
+        """
+        if out is None:
+            out = np.empty((self.n_vertices, 4), dtype=np.float32)
+        self.apply(self.quantize(values), out)
+        return out
+
+    def apply(self, indices, out: np.ndarray, previous=None):
+        """把颜色索引写入顶点颜色缓冲区
+
+        Parameters
+        ----------
+        indices : np.ndarray
+            (脑区,)或(顶点,)的颜色索引, 见:py:meth:`quantize`
+        out : np.ndarray
+            (顶点, 4)的float32顶点颜色缓冲区
+        previous : np.ndarray, optional
+            `out`中当前的颜色索引, 给出时只重写索引发生变化的脑区(或顶点)的顶点
+
+        Returns
+        -------
+        np.ndarray | None
+            被重写的顶点索引, 重写了所有顶点时为None
+        """
+        if self.per_vertex:
+            if previous is None:
+                self.lut.take(indices, axis=0, out=out)
+                return None
+            vertices = np.flatnonzero(indices != previous)
+            out[vertices] = self.lut.take(indices[vertices], axis=0)
+            return vertices
+
+        region_colors = self.lut.take(indices, axis=0)
+        if previous is None:
+            region_colors.take(self.labels, axis=0, out=out)
+            return None
+        vertices = self.regions.vertices(np.flatnonzero(indices != previous))
+        out[vertices] = region_colors.take(self.labels[vertices], axis=0)
+        return vertices
+
+
+class VertexColorPrefetcher:
+    """在后台线程中预先读取后续若干帧并计算其脑区颜色索引
+
+    显示时只重写与输出缓冲区中上一帧相比颜色索引发生变化的脑区的顶点.
+
+    Parameters
+    ----------
+    engine : VertexColorEngine
+        顶点颜色计算引擎
+    frame_source : Callable[[int], ArrayLike]
+        根据帧序号获取该帧脑区数值的函数
+    n_frames : int
+        总帧数
+    depth : int, optional
+        预先计算的帧数, 为0时不启用后台线程, by default 4
+    """
+
+    def __init__(self, engine: VertexColorEngine, frame_source, n_frames: int, depth=4):
+        self.engine = engine
+        self.frame_source = frame_source
+        self.n_frames = n_frames
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=1) if depth > 0 else None
+        self._pending = {}
+        # (输出缓冲区, 引擎版本, 缓冲区中的颜色索引)
+        self._shown = None
+
+    def colors_at(self, frame: int, step: int, out: np.ndarray):
+        """将第`frame`帧的顶点颜色写入`out`, 并安排计算之后以`step`为间隔的若干帧
+
+        Returns
+        -------
+        np.ndarray | None
+            被重写的顶点索引, 重写了所有顶点时为None
+        """
+        future = self._pending.pop(frame, None)
+        if future is not None and not future.cancelled():
+            indices = future.result()
+        else:
+            indices = self._quantize(frame)
+
+        previous = None
+        if self._shown is not None:
+            buffer, version, shown = self._shown
+            if buffer is out and version == self.engine.version:
+                previous = shown
+        changed = self.engine.apply(indices, out, previous)
+        self._shown = (out, self.engine.version, indices)
+
+        if self._executor is not None and step > 0:
+            for stale in [f for f in self._pending if f <= frame]:
+                self._pending.pop(stale).cancel()
+            for k in range(1, self.depth + 1):
+                next_frame = frame + k * step
+                if next_frame >= self.n_frames:
+                    break
+                if next_frame not in self._pending:
+                    self._pending[next_frame] = self._executor.submit(
+                        self._quantize, next_frame
+                    )
+        return changed
+
+    def _quantize(self, frame: int):
+        return self.engine.quantize(self.frame_source(frame))
+
+    def invalidate(self):
+        """颜色映射, 颜色范围, 脑区选择或帧数据发生变化后, 丢弃已经预先计算的帧"""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._shown = None
+
+    def shutdown(self):
+        self.invalidate()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class RegionColorizer:
+    """按脑区数值为表面着色
+
+    脑区数值先通过颜色映射注册表中预先计算的查找表得到每个脑区的颜色(与脑区数量成正比), 再通过一次`take`
+    收集到预分配的顶点颜色缓冲区中.
+
+    Parameters
+    ----------
+    labels : ArrayLike
+        每个顶点所属的脑区编号
+    """
+
+    def __init__(self, labels):
+        self.labels = np.ascontiguousarray(np.squeeze(labels), dtype=np.intp)
+        self.regions = RegionVertexIndex(self.labels)
+        self.vertex_colors = np.empty((len(self.labels), 4), dtype=np.float32)
+
+    def render(self, color_map, values):
+        """计算顶点颜色
+
+        Parameters
+        ----------
+        color_map : pg.ColorMap
+            颜色映射
+        values : ArrayLike
+            (脑区,)的脑区数值, 范围为[0, 1]
+
+        Returns
+        -------
+        np.ndarray
+            (顶点, 4)的顶点颜色, 为内部缓冲区的引用
+        """
+        region_colors = colormap_entry(color_map).map(values)
+        return region_colors.take(self.labels, axis=0, out=self.vertex_colors)
+
+    def update(self, color_map, values, regions):
+        """只重新计算`regions`中脑区的顶点颜色, 耗时与这些脑区的顶点数成正比
+
+        Parameters
+        ----------
+        color_map : pg.ColorMap
+            颜色映射
+        values : ArrayLike
+            (脑区,)的脑区数值, 范围为[0, 1]
+        regions : ArrayLike
+            颜色发生变化的脑区编号
+
+        Returns
+        -------
+        np.ndarray
+            被重写的顶点索引
+        """
+        regions = np.asarray(regions, dtype=np.intp)
+        vertices = self.regions.vertices(regions)
+        region_colors = np.zeros((len(values), 4), dtype=np.float32)
+        region_colors[regions] = colormap_entry(color_map).map(
+            np.asarray(values)[regions]
+        )
+        self.vertex_colors[vertices] = region_colors.take(self.labels[vertices], axis=0)
+        return vertices
+
+
+class RegionVertexIndex:
+    """按脑区排序的顶点索引, 每个脑区的顶点在`order`中是连续的一段
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        (顶点,)的顶点所属脑区编号
+    n_regions : int, optional
+        脑区数量, 默认为最大的脑区编号加1
+    """
+
+    def __init__(self, labels: np.ndarray, n_regions: "int | None" = None):
+        labels = np.asarray(labels, dtype=np.intp)
+        n = int(labels.max()) + 1 if len(labels) else 0
+        n = max(n, n_regions or 0)
+        self.order = np.argsort(labels, kind="stable")
+        # 没有所属脑区(编号为负)的顶点排在最前面
+        self.offsets = np.empty(n + 1, dtype=np.intp)
+        self.offsets[0] = np.count_nonzero(labels < 0)
+        np.cumsum(np.bincount(labels[labels >= 0], minlength=n), out=self.offsets[1:])
+        self.offsets[1:] += self.offsets[0]
+
+    def vertices(self, regions) -> np.ndarray:
+        """`regions`中各脑区的所有顶点索引"""
+        regions = np.asarray(regions, dtype=np.intp)
+        starts = self.offsets[regions]
+        lengths = self.offsets[regions + 1] - starts
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.order[positions + np.arange(len(positions))]
@@ -0,0 +1,92 @@
+"""顶点级(每个表面顶点一个数值)的时间序列
+
+顶点级仿真或MEG/EEG源重建得到的时间序列每帧有数万个数值, 通常保存在内存映射或分块
+存储中. 播放时逐帧读取(见:py:func:`.chunked_series.get_series_data`), 每帧量化为
+uint8的颜色索引, 只保留当前帧和下一帧.
+"""
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class VertexTimeSeries:
+    """顶点级的时间序列
+
+    提供时间序列页面所需的与`RegionalTimeSeries`相同的属性.
+
+    Parameters
+    ----------
+    data : ArrayLike
+        (时间, 顶点)的数据, 可以是np.memmap, h5py或zarr数据集
+    time : ArrayLike
+        (时间,)的时间点
+    atlas : Atlas
+        顶点所在表面对应的图谱, 用于脑区选择和显示脑区名称
+    sample_unit : str, optional
+        时间单位, by default "ms"
+    name : str, optional
+        名称, 默认为数据的形状
+    """
+
+    def __init__(self, data, time, atlas, sample_unit: str = "ms", name: str = ""):
+        self.data = data
+        self.time = np.asarray(time)
+        self.start_time = float(self.time[0]) if len(self.time) else 0.0
+        self.sample_period = (
+            float(self.time[1] - self.time[0]) if len(self.time) > 1 else 1.0
+        )
+        self.sample_unit = SimpleNamespace(value=sample_unit)
+        self.space = SimpleNamespace(atlas=atlas)
+        self.name = name or "x".join(map(str, data.shape))
+        # 缓存和页面以gid为键, 每个实例唯一, 不会与已被回收的实例重复
+        self._gid = SimpleNamespace(str=f"vertex:{uuid.uuid4().hex}")
+
+    @classmethod
+    def from_npy(cls, path, atlas, sample_period: float = 1.0, **kwargs):
+        """以内存映射的方式打开(时间, 顶点)的.npy文件, 时间点从0开始按采样周期排列"""
+        data = np.load(path, mmap_mode="r")
+        if data.ndim != 2:
+            raise ValueError(f"'{path}' is not a (time, vertex) array")
+        time = np.arange(data.shape[0]) * sample_period
+        return cls(data, time, atlas, name=str(path), **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+def is_vertex_series(timeseries, n_vertices: int, vertex_mode: bool = False) -> bool:
+    """时间序列是否为顶点级时间序列
+
+    列数等于表面的顶点数(且不等于图谱的脑区数)时为顶点级时间序列, 其余情况与以前一样
+    作为脑区时间序列处理.
+
+    Parameters
+    ----------
+    timeseries : RegionalTimeSeries | VertexTimeSeries
+        时间序列
+    n_vertices : int
+        显示时间序列的表面的顶点数
+    vertex_mode : bool, optional
+        用户明确要求按顶点级时间序列显示(如:py:class:`VertexTimeSeries`), by default False
+
+    Raises
+    ------
+    ValueError
+        `vertex_mode`为True但列数不等于顶点数
+    """
+    columns = timeseries.data.shape[1]
+    n_regions = timeseries.space.atlas.number_of_regions
+    if not vertex_mode:
+        return columns == n_vertices and columns != n_regions
+    if columns == n_vertices:
+        return True
+    if columns == n_regions:
+        raise ValueError(
+            "The file has one column per region, "
+            "import it as a regional time series instead"
+        )
+    raise ValueError(
+        f"The time series has {columns} columns, "
+        f"expected {n_vertices} surface vertices"
+    )
@@ -1,12 +1,21 @@
 import numpy as np
-import pyqtgraph as pg
 from PyQt5.QtCore import pyqtSignal
 from pyqtgraph.opengl.shaders import FragmentShader, ShaderProgram, VertexShader
-from qfluentwidgets import FluentIcon, Flyout, FlyoutAnimationType, InfoBarIcon
+from qfluentwidgets import (
+    FluentIcon,
+    Flyout,
+    FlyoutAnimationType,
+    InfoBarIcon,
+    PushButton,
+)
 
-from zjb.main.api import Atlas, Subject, Surface, SurfaceRegionMapping
+from zjb.main.api import Atlas, Subject
 
 from .._rc import find_resource_file
+from ..common.colormaps import list_colormaps
+from ..common.surface_cache import find_surface_data
+from ..common.vertex_colors import RegionColorizer
+from ..widgets.surface_montage_view import SurfaceMontageView
 from .atlas_surface_page_ui import Ui_atlas_surface_page
 from .base_page import BasePage
 
@@ -32,6 +41,14 @@ class AtlasSurfacePage(BasePage):
         self.ui.base_color_slider.setValue(75)
         self.ui.base_color_slider.setEnabled(False)
 
+        self.montage = None
+        self.montage_btn = PushButton(FluentIcon.TILES, "Montage", self)
+        self.montage_btn.setCheckable(True)
+        self.ui.horizontalLayout.insertWidget(
+            self.ui.horizontalLayout.count() - 1, self.montage_btn
+        )
+        self.montage_btn.toggled.connect(self._on_montage_btn_toggled)
+
         self.ui.brain_regions_panel.region_signal_list.connect(
             self._on_region_signal_change
         )
@@ -44,11 +61,7 @@ class AtlasSurfacePage(BasePage):
         self.ui.brain_regions_panel.show_tree_brain_regions(self.atlas)
 
     def _show_atlas(self):
-        for data_key in self.subject.data:
-            if isinstance(self.subject.data[data_key], Surface):
-                self.surface = self.subject.data[data_key]
-            elif isinstance(self.subject.data[data_key], SurfaceRegionMapping):
-                self.surface_region_mapping = self.subject.data[data_key]
+        self.surface, self.surface_region_mapping = find_surface_data(self.subject)
 
         self.ui.atlas_surface_view_widget.setAtlas(
             self.atlas, self.surface, self.surface_region_mapping
@@ -57,17 +70,21 @@ class AtlasSurfacePage(BasePage):
             self.atlas, self.surface_region_mapping
         )
 
+        # 脑区着色状态: 每个脑区的颜色值及被选中脑区的掩码
+        n_regions = self.atlas.number_of_regions
+        self.region_values = np.zeros(n_regions)
+        self.selected_mask = np.zeros(n_regions, dtype=bool)
+        self.colorizer = RegionColorizer(
+            self.ui.atlas_surface_view_widget.geometry.labels
+        )
+
         self._on_color_number_changed("20")
         self._on_choose_colorbar_cbb_changed("default")
 
     def _init_configure(self):
         # colorbar选择
-        self.list_of_maps_matplotlib = sorted(
-            pg.colormap.listMaps("matplotlib"), key=lambda x: x.lower()
-        )
-        self.list_of_maps_colorcet = sorted(
-            pg.colormap.listMaps("colorcet"), key=lambda x: x.lower()
-        )
+        self.list_of_maps_matplotlib = list_colormaps("matplotlib")
+        self.list_of_maps_colorcet = list_colormaps("colorcet")
 
         # 颜色选择
         self.ui.choose_colorbar_cbb.clear()
@@ -105,7 +122,6 @@ class AtlasSurfacePage(BasePage):
             self._on_base_color_slider_changed
         )
 
-        self.selectedRegions = []
 
     def _on_choose_colorbar_cbb_changed(self, colorbar_name):
         if colorbar_name == "BNA-standard":
@@ -123,23 +139,18 @@ class AtlasSurfacePage(BasePage):
             self.ui.atlas_surface_view_widget.setColorMap(
                 colorbar_name, source="colorcet"
             )
+        self._apply_region_colors()
 
     def _on_color_number_changed(self, color_number):
         if color_number.isnumeric() and int(color_number) > 0:
             color_number = int(color_number)
             if color_number > 10000:
                 color_number = 9999
-            self.regioncolor_list = list(np.linspace(0, 1, color_number)) * (
-                int(self.atlas.number_of_regions / color_number) + 1
-            )
-            self.ui.atlas_surface_view_widget.setRegionColor(
-                self.surface_region_mapping, self.regioncolor_list
+            # 颜色值在[0, 1]内等间隔循环分配给各脑区
+            self.region_values = np.resize(
+                np.linspace(0, 1, color_number), len(self.region_values)
             )
-            self.regioncolor_list_contrast = self.regioncolor_list[:]
-            self.base_color_value = self.ui.base_color_slider.value() / 100
-            self.regioncolor_list_contrast = [
-                self.base_color_value for _ in self.regioncolor_list_contrast
-            ]
+            self._apply_region_colors()
             # self.ui.base_color_slider.setEnabled(False)
 
     def _on_choose_shader_cbb_changed(self, shader_name):
@@ -177,37 +188,65 @@ class AtlasSurfacePage(BasePage):
         else:
             shader_program = shader_name
         self.ui.atlas_surface_view_widget.setShader(shader_program)
+        if self.montage is not None:
+            self.montage.setShader(shader_program)
+
+    def _on_montage_btn_toggled(self, checked: bool):
+        """在主表面视图和共享颜色缓冲区的多视角蒙太奇之间切换"""
+        widget = self.ui.atlas_surface_view_widget
+        if checked and self.montage is None:
+            self.montage = SurfaceMontageView(widget, self)
+            index = self.ui.horizontalLayout_3.indexOf(widget)
+            stretch = self.ui.horizontalLayout_3.stretch(index)
+            self.ui.horizontalLayout_3.insertWidget(index, self.montage, stretch)
+        if self.montage is not None:
+            self.montage.setVisible(checked)
+        widget.setVisible(not checked)
+
+    @property
+    def base_color_value(self):
+        return self.ui.base_color_slider.value() / 100
+
+    @property
+    def selectedRegions(self):
+        return np.flatnonzero(self.selected_mask).tolist()
+
+    def _apply_region_colors(self, regions=None):
+        """根据脑区着色状态计算顶点的颜色
+
+        选择过脑区后(底色滑块启用), 未被选中的脑区显示为底色.
+
+        Parameters
+        ----------
+        regions : list[int], optional
+            颜色发生变化的脑区, 为None时重新计算所有顶点的颜色
+        """
+        widget = self.ui.atlas_surface_view_widget
+        if not hasattr(self, "colorizer") or widget.color_map is None:
+            return
+        if self.ui.base_color_slider.isEnabled():
+            values = np.where(
+                self.selected_mask, self.region_values, self.base_color_value
+            )
+        else:
+            values = self.region_values
+        if regions is None:
+            colors, changed = self.colorizer.render(widget.color_map, values), None
+        else:
+            # 点击脑区时只重写该脑区的顶点
+            colors = self.colorizer.vertex_colors
+            changed = self.colorizer.update(widget.color_map, values, regions)
+        widget.setVertexColors(colors, changed)
 
     def _on_base_color_slider_changed(self):
-        self.regioncolor_list_contrast = [
-            self.ui.base_color_slider.value() / 100
-            if i not in self.selectedRegions
-            else n
-            for i, n in enumerate(self.regioncolor_list_contrast)
-        ]
-        self.ui.atlas_surface_view_widget.setRegionColor(
-            self.surface_region_mapping, self.regioncolor_list_contrast
-        )
-        self.base_color_value = self.ui.base_color_slider.value() / 100
+        self._apply_region_colors()
 
     def _get_region(self, region_number):
+        # 第一次选择脑区时其他脑区都变为底色
+        regions = [region_number] if self.ui.base_color_slider.isEnabled() else None
         self.ui.base_color_slider.setEnabled(True)
-        if region_number in self.selectedRegions:
-            self.selectedRegions.remove(region_number)
-        else:
-            self.selectedRegions.append(region_number)
-        regioncolor_array = np.full(
-            len(self.regioncolor_list),
-            self.ui.base_color_slider.value() / 100,
-            dtype=float,
-        )
-        regioncolor_array[self.selectedRegions] = np.array(self.regioncolor_list)[
-            self.selectedRegions
-        ]
-        self.regioncolor_list_contrast = list(regioncolor_array)
-        self.ui.atlas_surface_view_widget.setRegionColor(
-            self.surface_region_mapping, self.regioncolor_list_contrast
-        )
+        self.selected_mask[region_number] = not self.selected_mask[region_number]
+        self._apply_region_colors(regions)
 
         # 点击后传出信号：被选中的脑区
         self.currentRegionClicked.emit(region_number, self.selectedRegions)
@@ -250,18 +289,7 @@ class AtlasSurfacePage(BasePage):
         self.select_regions(number_list_regions)
 
     def select_regions(self, number_list_regions):
-        self.selectedRegions = number_list_regions
+        self.selected_mask[:] = False
+        self.selected_mask[np.asarray(number_list_regions, dtype=np.intp)] = True
         self.ui.base_color_slider.setEnabled(True)
-        if hasattr(self, "regioncolor_list"):
-            regioncolor_array = np.full(
-                len(self.regioncolor_list),
-                self.ui.base_color_slider.value() / 100,
-                dtype=float,
-            )
-            regioncolor_array[self.selectedRegions] = np.array(self.regioncolor_list)[
-                self.selectedRegions
-            ]
-            self.regioncolor_list_contrast = list(regioncolor_array)
-            self.ui.atlas_surface_view_widget.setRegionColor(
-                self.surface_region_mapping, self.regioncolor_list_contrast
-            )
+        self._apply_region_colors()
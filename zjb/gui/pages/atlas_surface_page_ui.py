@@ -87,4 +87,4 @@ class Ui_atlas_surface_page(object):
         self.StrongBodyLabel_4.setText(_translate("atlas_surface_page", "Base Color"))
 from qfluentwidgets import ComboBox, LineEdit, Slider, StrongBodyLabel
 from zjb.gui.panels.brain_regions_panel import BrainRegionsPanel
-from zjb.main.visualization.surface_space import AtlasSurfaceViewWidget
+from zjb.gui.widgets.atlas_surface_view_widget import AtlasSurfaceViewWidget
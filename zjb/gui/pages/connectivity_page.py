@@ -1,13 +1,17 @@
-import collections
+import os
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from qfluentwidgets import FluentIcon
+from PyQt5.QtWidgets import QFileDialog, QVBoxLayout, QWidget
+from qfluentwidgets import ComboBox, FluentIcon, PushButton
 
 from zjb.main.api import Connectivity
 
-from ..libs import pycircos
+from ..common.circos_export import export_circos
+from ..common.edge_selection import DEFAULT_TOP_K, EdgeSelection, select_edges
+from ..common.heatmap_pyramid import POOLING_MODES
+from ..common.sparse_connectivity import as_csr, is_sparse
+from ..common.utils import show_error, show_success
+from ..widgets.chord_diagram_item import ChordDiagramWidget
 from .base_page import BasePage
 from .connectivity_page_ui import Ui_connectivity_page
 
@@ -17,9 +21,17 @@ class ConnectivityPage(BasePage):
         super().__init__(connectivity._gid.str, "Connectivity", FluentIcon.FIT_PAGE)
         self.connectivity = connectivity
         self.atlas = connectivity.space.atlas
+        # 连接矩阵可以是scipy.sparse的稀疏矩阵, 只转换一次为CSR格式, 不转换为稠密矩阵
+        data = connectivity.data
+        self.matrix = as_csr(data) if is_sparse(data) else data
 
         self._connectivity = None
         self.br_selected = None
+        # 环形图中显示的边: 权重最大的k条, 及可选的绝对阈值和百分位阈值
+        self.edge_top_k = DEFAULT_TOP_K
+        self.edge_threshold = None
+        self.edge_percentile = None
+        self.edges: "EdgeSelection | None" = None
 
         self._setup_ui()
         self.setObjectName(connectivity._gid.str)
@@ -27,6 +39,22 @@ class ConnectivityPage(BasePage):
     def _setup_ui(self):
         self.ui = Ui_connectivity_page()
         self.ui.setupUi(self)
+
+        # 热图上方的池化方式选择, 缩小显示时每个像素取块内的最大值或平均值
+        index = self.ui.splitter.indexOf(self.ui.connectivity_widget)
+        heatmap_panel = QWidget(self.ui.splitter)
+        heatmap_layout = QVBoxLayout(heatmap_panel)
+        heatmap_layout.setContentsMargins(0, 0, 0, 0)
+        self.pooling_combo = ComboBox(heatmap_panel)
+        for mode in POOLING_MODES:
+            self.pooling_combo.addItem(f"Block {mode}", userData=mode)
+        self.pooling_combo.setCurrentIndex(
+            POOLING_MODES.index(self.ui.connectivity_widget.pooling_mode)
+        )
+        self.pooling_combo.currentIndexChanged.connect(self._on_pooling_mode_changed)
+        heatmap_layout.addWidget(self.pooling_combo)
+        heatmap_layout.addWidget(self.ui.connectivity_widget, 1)
+        self.ui.splitter.insertWidget(index, heatmap_panel)
         self.ui.splitter.setSizes([500, 2000, 2000])
 
         self.ui.brain_regions_panel.region_signal_list.connect(
@@ -34,8 +62,20 @@ class ConnectivityPage(BasePage):
         )
         self.ui.brain_regions_panel.show_tree_brain_regions(self.atlas)
 
+        # 环形图: 原生的弦图用于交互显示, matplotlib的环形图只用于导出
+        self.export_btn = PushButton(FluentIcon.SAVE, "Export PDF", self)
+        self.export_btn.clicked.connect(self._on_export_btn_clicked)
+        self.ui.circos_widget.vertical_layout.addWidget(self.export_btn)
+        self.chord_widget = ChordDiagramWidget(self.ui.circos_widget)
+        self.chord_widget.item.setRegions(self.atlas.labels)
+        self.chord_widget.item.regionHovered.connect(self._on_chord_region_hovered)
+        self.ui.circos_widget.vertical_layout.addWidget(self.chord_widget, 1)
+
         self._set_connectivity()
 
+    def _on_pooling_mode_changed(self):
+        self.ui.connectivity_widget.setPoolingMode(self.pooling_combo.currentData())
+
     def _set_connectivity(self):
         """设置要可视化的连接矩阵"""
         self.ui.connectivity_widget.setConnectivity(self.connectivity)
@@ -49,85 +89,63 @@ class ConnectivityPage(BasePage):
         if self.connectivity is not None:
             self._get_connectivity_data()
 
+    def setEdgeSelection(self, k=DEFAULT_TOP_K, threshold=None, percentile=None):
+        """设置环形图中显示的边
+
+        Parameters
+        ----------
+        k : int | None, optional
+            最多显示的边数, 为None时不限制, by default :py:data:`DEFAULT_TOP_K`
+        threshold : float, optional
+            权重的绝对阈值
+        percentile : float, optional
+            权重的百分位阈值(0~100)
+        """
+        self.edge_top_k = k
+        self.edge_threshold = threshold
+        self.edge_percentile = percentile
+        if isinstance(self.br_selected, list):
+            self._circos_update()
+
     def _get_connectivity_data(self):
         # 根据br_selected获得要显示的数据
         self.br_name_selected = np.squeeze(self.atlas.labels[[self.br_selected]])
         self._circos_update()
 
     def _circos_update(self):
-        for i in reversed(range(self.ui.circos_widget.vertical_layout.count())):
-            self.ui.circos_widget.vertical_layout.removeWidget(
-                self.ui.circos_widget.vertical_layout.itemAt(i).widget().deleteLater()
-            )
-
-        Garc = pycircos.Garc
-        Gcircle = pycircos.Gcircle
-
-        # Set chromosomes
-        circle = Gcircle(figsize=(8, 8))
-        for region_label in self.atlas.labels:
-            arc = Garc(
-                arc_id=region_label,
-                size=20,
-                interspace=0.5,
-                raxis_range=(735, 785),
-                labelposition=100,
-                label_visible=True,
-                labelsize=5,
-            )
-            circle.add_garc(arc)
-        circle.set_garcs(0, 360)
-
-        # linkplot
-        values_all = []
-        br_selected = np.sort(self.br_selected)
-        arcdata_dict = collections.defaultdict(dict)
-
-        f = self.connectivity.data
-        f_1 = np.triu(f, 1)
-        link_selected = np.squeeze(f_1[[br_selected]])
-
-        for br_num in range(30):
-            if len(br_selected) == 0:
-                pass
-            else:
-                if len(br_selected) == 1:
-                    np.max(link_selected)
-                    positions = np.where(link_selected == np.max(link_selected))
-                    name1_index = int(br_selected)
-                    name2_index = int(positions[0])
-                    link_selected[name2_index] = 0
-
-                else:
-                    np.max(link_selected)
-                    positions = np.where(link_selected == np.max(link_selected))
-                    positions_1 = int(positions[0])
-                    name1_index = br_selected[positions_1]
-                    name2_index = int(positions[1])
-                    link_selected[positions_1, name2_index] = 0
-
-                name1 = "".join(self.atlas.labels[name1_index].rstrip())
-                name2 = "".join(self.atlas.labels[name2_index].rstrip())
-
-                source = (name1, 5, 15, 735)
-                destination = (name2, 5, 15, 735)
-                circle.chord_plot(
-                    source,
-                    destination,
-                    facecolor=circle.garc_dict[name1].facecolor,
-                    edgecolor=circle.garc_dict[name1].facecolor,
-                    linewidth=0.5,
-                )
-
-        ax = plt.gca()
-        ax.set_facecolor("black")
-        texts = ax.findobj(match=plt.Text)
-        for text in texts:
-            text.set_color("white")
-        circle.figure.set_facecolor("black")
-        canvas = FigureCanvas(circle.figure)
-
-        self.ui.circos_widget.vertical_layout.addWidget(canvas)
+        # linkplot: 与选中脑区相连的权重最大的边
+        self.edges = select_edges(
+            self.matrix,
+            self.br_selected,
+            k=self.edge_top_k,
+            threshold=self.edge_threshold,
+            percentile=self.edge_percentile,
+        )
+        self.chord_widget.item.setEdges(self.edges.sources, self.edges.targets)
+
+    def _on_chord_region_hovered(self, region: int):
+        self.chord_widget.setToolTip(
+            str(self.atlas.labels[region]).rstrip() if region >= 0 else ""
+        )
+
+    def _on_export_btn_clicked(self):
+        """用matplotlib绘制当前的环形图并导出为PDF"""
+        name, _ = QFileDialog.getSaveFileName(
+            self, "Export Circos", "circos.pdf", "PDF (*.pdf)"
+        )
+        if not name:
+            return
+        edges = self.edges if self.edges is not None else []
+        try:
+            export_circos(self.atlas.labels, edges, os.path.splitext(name)[0])
+        except OSError as e:
+            show_error(str(e), self.window())
+        else:
+            show_success(f"Saved to {name}", self.window())
 
     def _on_region_signal_change(self, number_list_regions):
         self.select_regions(number_list_regions)
+
+    def closeEvent(self, event):
+        self.chord_widget.item.shutdown()
+        super().closeEvent(event)
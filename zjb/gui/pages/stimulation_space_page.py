@@ -5,11 +5,12 @@ from qfluentwidgets import FluentIcon
 
 from zjb.gui.panels.stimulation_brain_tree_panel import StimulationBrainTreePanel
 from zjb.gui.panels.stimulation_value_panel import StimulationValuePanel
-from zjb.main.api import Atlas, Subject, Surface, SurfaceRegionMapping
-from zjb.main.visualization.surface_space import AtlasSurfaceViewWidget
+from zjb.main.api import Atlas, Subject
+from zjb.gui.widgets.atlas_surface_view_widget import AtlasSurfaceViewWidget
 
 from .._global import GLOBAL_SIGNAL
 from .._rc import find_resource_file
+from ..common.surface_cache import find_surface_data
 from .base_page import BasePage
 
 # import pyqtgraph as pg
@@ -121,11 +122,7 @@ class StimulationSpacePage(BasePage):
 
     def _show_atlas(self):
         """初始化3D脑图谱"""
-        for data_key in self.subject.data:
-            if isinstance(self.subject.data[data_key], Surface):
-                self.surface = self.subject.data[data_key]
-            elif isinstance(self.subject.data[data_key], SurfaceRegionMapping):
-                self.surface_region_mapping = self.subject.data[data_key]
+        self.surface, self.surface_region_mapping = find_surface_data(self.subject)
         self.stimulation_space_view_widget.setAtlas(
             self.atlas, self.surface, self.surface_region_mapping
         )
@@ -140,12 +137,13 @@ class StimulationSpacePage(BasePage):
         )
         self.regioncolor_list = [item for item in self.default_regioncolor_list]
         _setregioncolor = [format_value(item) for item in self.regioncolor_list]
-        self.stimulation_space_view_widget.setRegionColor(
-            self.surface_region_mapping, _setregioncolor
-        )
+        # 先设置颜色映射, 脑区着色时使用
         self.stimulation_space_view_widget.setColorMap(
             "./" + find_resource_file("colorbar/CET-ZJB.csv", abs=False)
         )
+        self.stimulation_space_view_widget.setRegionColor(
+            self.surface_region_mapping, _setregioncolor
+        )
         # self.legendLabels = np.linspace(1.0, -1.0, 5)
         # self.legendPos = np.linspace(1, 0, 5)
         # self.legend = dict(
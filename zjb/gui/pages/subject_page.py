@@ -12,13 +12,16 @@ from qfluentwidgets import (
     TitleLabel,
 )
 
-from zjb.main.api import Project, RegionalConnectivity, RegionSpace, Subject
+from zjb.main.api import Atlas, Project, RegionalConnectivity, RegionSpace, Subject
 
-from .._global import get_workspace
+from .._global import GLOBAL_SIGNAL, get_workspace
+from ..common.surface_cache import find_surface_data
 from ..common.utils import show_error
+from ..common.vertex_series import VertexTimeSeries, is_vertex_series
 from ..panels.data_dict_panel import SubjectDataDictPanel
 from ..widgets.file_editor import OpenFileEditor
 from .base_page import BasePage
+from .time_series_page import RegionalTimeSeriesPage
 
 
 class SubjectPage(BasePage):
@@ -60,6 +63,9 @@ class SubjectPage(BasePage):
         self.btn_import_connectivity = PrimaryPushButton("Import Connectivity")
         self.btn_import_connectivity.clicked.connect(self._import_connectivity)
         self.button_group_layout.addWidget(self.btn_import_connectivity)
+        self.btn_open_vertex_series = PrimaryPushButton("Open Vertex Time Series")
+        self.btn_open_vertex_series.clicked.connect(self._open_vertex_series)
+        self.button_group_layout.addWidget(self.btn_open_vertex_series)
 
         # for name, data in self.subject.data.items():
         #     data_manipulation_panel = DataOperationPanel(name, data, self.project)
@@ -86,6 +92,29 @@ class SubjectPage(BasePage):
             )
             self._subject.data |= {name: connectivity}
 
+    def _open_vertex_series(self):
+        """以内存映射的方式打开顶点级时间序列(.npy), 在被试的表面上播放"""
+        dialog = OpenVertexSeriesDialog(self.window())
+        if not dialog.exec():
+            return
+        surface, _ = find_surface_data(self._subject)
+        if surface is None:
+            show_error(f"Subject '{self._subject.name}' has no surface", self.window())
+            return
+        try:
+            sample_period = float(dialog.period_edit.text())
+            timeseries = VertexTimeSeries.from_npy(
+                dialog.file_editor.text(), dialog.current_atlas, sample_period
+            )
+            is_vertex_series(timeseries, len(surface.vertices), vertex_mode=True)
+        except (OSError, ValueError) as e:
+            show_error(str(e), self.window())
+            return
+        GLOBAL_SIGNAL.requestAddPage.emit(
+            timeseries._gid.str + "Visualization",
+            lambda _: RegionalTimeSeriesPage(timeseries, self._subject),
+        )
+
     def updata_list(self, event):
         """添加新的数据以后，调用方法更新数据列表
 
@@ -123,3 +152,31 @@ class ImportConnectivityDialog(MessageBoxBase):
     @property
     def current_space(self) -> RegionSpace:
         return self.combo.currentData()  # type: ignore
+
+
+class OpenVertexSeriesDialog(MessageBoxBase):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.viewLayout.addWidget(SubtitleLabel("Open Vertex Time Series"))
+        self.formLayout = QFormLayout()
+        self.viewLayout.addLayout(self.formLayout)
+
+        self.file_editor = OpenFileEditor(filter="Numpy Array (*.npy)")
+        self.formLayout.addRow(BodyLabel("File:"), self.file_editor)
+
+        self.period_edit = LineEdit()
+        self.period_edit.setText("1")
+        self.formLayout.addRow(BodyLabel("Sample Period (ms):"), self.period_edit)
+
+        self.combo = ComboBox()
+        self.formLayout.addRow(BodyLabel("Atlas:"), self.combo)
+
+        ws = get_workspace()
+        assert ws
+        for atlas in ws.atlases:
+            self.combo.addItem(atlas.name, userData=atlas)
+
+    @property
+    def current_atlas(self) -> Atlas:
+        return self.combo.currentData()  # type: ignore
@@ -1,19 +1,52 @@
+import copy
+
 import numpy as np
 import pyqtgraph.opengl as gl
-from PyQt5 import QtCore
-from qfluentwidgets import FluentIcon
+from qfluentwidgets import BodyLabel, FluentIcon, PushButton
 import sip
 
-from zjb.main.api import Atlas, RegionalTimeSeries, Subject, Surface, SurfaceRegionMapping
+from zjb.main.api import (
+    Atlas,
+    PSEResult,
+    RegionalTimeSeries,
+    SimulationResult,
+    Subject,
+)
 
 from .._global import GLOBAL_SIGNAL
 from .._rc import find_resource_file
+from ..common.chunked_series import get_series_data, release_series_data
+from ..common.movie_export import MovieExporter
+from ..common.playback import PlaybackScheduler
+from ..common.series_stats import SERIES_STATISTICS
+from ..common.surface_cache import find_surface_data
+from ..common.utils import show_error, show_info, show_success
+from ..common.vertex_colors import VertexColorEngine, VertexColorPrefetcher
+from ..common.vertex_series import VertexTimeSeries, is_vertex_series
+from ..widgets.comparison_surface_view import ComparisonSurfaceView
+from ..widgets.extract_data_dialog import PSEDataDialog, SelectData, SimulationResultDialog
+from ..widgets.movie_export_dialog import MovieExportDialog
+from ..widgets.surface_montage_view import SurfaceMontageView
 from .base_page import BasePage
 from .time_series_page_ui import Ui_time_series_page
 
 
+PREFETCH_FRAMES = 4
+"""播放时在后台预先计算顶点颜色的帧数"""
+TARGET_FPS = 30
+"""播放的目标帧率"""
+SPEED_SLIDER_UNITY = 5
+"""速度滑块取该值时, 以目标帧率逐帧播放"""
+SPEED_SLIDER_MAX = 10
+"""速度滑块的最大值, 对应逐帧播放速率的32倍"""
+
+
 class RegionalTimeSeriesPage(BasePage):
-    def __init__(self, regional_timeseries: RegionalTimeSeries, subject: Subject):
+    def __init__(
+        self,
+        regional_timeseries: "RegionalTimeSeries | VertexTimeSeries",
+        subject: Subject,
+    ):
         super().__init__(regional_timeseries._gid.str + "Visualization", "Time Series", FluentIcon.SPEED_HIGH)
         self.timeseries = regional_timeseries
         self.atlas = regional_timeseries.space.atlas
@@ -26,8 +59,45 @@ class RegionalTimeSeriesPage(BasePage):
     def _setup_ui(self):
         self.ui = Ui_time_series_page()
         self.ui.setupUi(self)
+        self.comparisons: list[ComparisonSurfaceView] = []
 
         self.ui.time_edit.setMinimumSize(160, 20)
+        self.fps_label = BodyLabel(self)
+        self.ui.horizontalLayout.addWidget(self.fps_label)
+        self.hover_label = BodyLabel(self)
+        self.ui.horizontalLayout.addWidget(self.hover_label)
+        self._hovered_region = -1
+        self.ui.atlas_surface_view_widget.regionHovered.connect(
+            self._on_region_hovered
+        )
+        self.export_btn = PushButton(FluentIcon.VIDEO, "Export Movie", self)
+        self.ui.horizontalLayout_2.insertWidget(
+            self.ui.horizontalLayout_2.indexOf(self.ui.update_btn) + 1,
+            self.export_btn,
+        )
+        self.export_btn.clicked.connect(self._on_export_btn_clicked)
+        self.exporter = None
+        self.compare_btn = PushButton(FluentIcon.ADD, "Compare", self)
+        self.ui.horizontalLayout_2.insertWidget(
+            self.ui.horizontalLayout_2.indexOf(self.export_btn) + 1, self.compare_btn
+        )
+        self.compare_btn.clicked.connect(self._on_compare_btn_clicked)
+        self.montage = None
+        self.montage_btn = PushButton(FluentIcon.TILES, "Montage", self)
+        self.montage_btn.setCheckable(True)
+        self.ui.horizontalLayout_2.insertWidget(
+            self.ui.horizontalLayout_2.indexOf(self.compare_btn) + 1, self.montage_btn
+        )
+        self.montage_btn.toggled.connect(self._on_montage_btn_toggled)
+        # 堆叠曲线: 所有选中脑区的曲线由少量绘图对象绘制, 关闭时每个脑区一条曲线
+        self.stacked_btn = PushButton(FluentIcon.MENU, "Stacked Traces", self)
+        self.stacked_btn.setCheckable(True)
+        self.stacked_btn.setChecked(True)
+        self.ui.horizontalLayout_2.insertWidget(
+            self.ui.horizontalLayout_2.indexOf(self.montage_btn) + 1, self.stacked_btn
+        )
+        self.stacked_btn.toggled.connect(self.ui.time_series_widget.setStackedTraces)
+        self._rendering = False
         self._set_time_series()
         self._show_atlas()
         self.ui.brain_regions_panel.region_signal_list.connect(
@@ -35,6 +105,7 @@ class RegionalTimeSeriesPage(BasePage):
         )
         self.ui.brain_regions_panel.show_tree_brain_regions(self.atlas)
 
+        self.ui.speed_slider.setRange(0, SPEED_SLIDER_MAX)
         self.ui.speed_slider.setValue(0)
         self.ui.speed_slider.valueChanged.connect(self._on_speed_slider_changed)
 
@@ -46,11 +117,6 @@ class RegionalTimeSeriesPage(BasePage):
         self.ui.start_btn.clicked.connect(self._on_start_btn_clicked)
 
     def _show_atlas(self):
-        for data_key in self.subject.data:
-            if isinstance(self.subject.data[data_key], Surface):
-                self.surface = self.subject.data[data_key]
-            elif isinstance(self.subject.data[data_key], SurfaceRegionMapping):
-                self.surface_region_mapping = self.subject.data[data_key]
         self.ui.atlas_surface_view_widget.clear()
         self.ui.atlas_surface_view_widget.setAtlas(
             self.atlas, self.surface, self.surface_region_mapping
@@ -58,56 +124,131 @@ class RegionalTimeSeriesPage(BasePage):
         self.ui.atlas_surface_view_widget.setColorMap(
             "./" + find_resource_file("colorbar/CET-ZJB.csv", abs=False)
         )
+        self._setup_color_engine()
         self.ui.time_slider.setValue(0)
         self.setColorBar()
         self._update()
 
+    def _setup_color_engine(self):
+        """创建顶点颜色计算引擎及预分配的顶点颜色缓冲区"""
+        self.color_engine = VertexColorEngine(
+            self.ui.atlas_surface_view_widget.color_map,
+            self.ui.atlas_surface_view_widget.geometry.labels,
+            self.num_brainregion,
+            per_vertex=self.per_vertex,
+        )
+        self.vertex_colors = np.empty(
+            (self.color_engine.n_vertices, 4), dtype=np.float32
+        )
+        self.color_prefetcher = VertexColorPrefetcher(
+            self.color_engine,
+            lambda t: self.series_data[t],
+            self.max_time,
+            depth=self.prefetch_frames,
+        )
+
     def _set_time_series(self):
-        (self.max_time, self.num_brainregion) = self.timeseries.data.shape
-        self.ui.time_slider.setMaximum(self.max_time)
-        self.ui.up_color_edit.setText(str(round(self.timeseries.data.max(), 2)))
-        self.ui.low_color_edit.setText(str(round(self.timeseries.data.min(), 2)))
+        # 内存映射或分块存储的数据只按需读入当前帧所在的块
+        self.series_data = get_series_data(self.timeseries)
+        (self.max_time, self.n_columns) = self.series_data.shape
+        self.num_brainregion = self.atlas.number_of_regions
+        # 顶点级时间序列逐帧读取, 只预先计算下一帧的颜色索引;
+        # 每帧数万条曲线无法绘制, 不显示曲线控件
+        self.surface, self.surface_region_mapping = find_surface_data(self.subject)
+        # 只有通过"Open Vertex Time Series"打开的时间序列严格要求按顶点显示
+        self.per_vertex = self.surface is not None and is_vertex_series(
+            self.timeseries,
+            len(self.surface.vertices),
+            vertex_mode=isinstance(self.timeseries, VertexTimeSeries),
+        )
+        self.prefetch_frames = 1 if self.per_vertex else PREFETCH_FRAMES
+        self.ui.time_series_widget.setVisible(not self.per_vertex)
+        self.stacked_btn.setVisible(not self.per_vertex)
+        self.ui.time_slider.setMaximum(self.max_time - 1)
+        # 颜色范围来自共享的统计量缓存, 尚未计算完成时在完成后自动更新
+        SERIES_STATISTICS.statisticsReady.connect(self._on_statistics_ready)
+        statistics = SERIES_STATISTICS.get(self.timeseries)
+        if statistics is not None:
+            self._set_color_range(statistics)
         self.colorbar_max = float(self.ui.up_color_edit.text())
         self.colorbar_min = float(self.ui.low_color_edit.text())
         self.ui.speed_slider.setValue(0)
         self.ui.start_btn.setText("Start")
         self.ui.start_btn.setChecked(True)
-        self.ui.time_series_widget.setTimeSeries(self.timeseries)
+        self._update_time_series_widget()
+
+    def _update_time_series_widget(self):
+        if not self.per_vertex:
+            self.ui.time_series_widget.setTimeSeries(self.timeseries)
+
+    def _set_color_range(self, statistics):
+        self.ui.up_color_edit.setText(str(round(statistics.global_max, 2)))
+        self.ui.low_color_edit.setText(str(round(statistics.global_min, 2)))
+
+    def _on_statistics_ready(self, gid: str):
+        if sip.isdeleted(self) or gid != self.timeseries._gid.str:
+            return
+        statistics = SERIES_STATISTICS.get(self.timeseries)
+        if statistics is None:
+            # 发出信号后统计量已被移除(如被LRU淘汰), get重新开始计算, 完成后再次更新
+            return
+        self._set_color_range(statistics)
+        self._on_update_btn_clicked()
 
     def setColorBar(self):
         self.colorbar_max = float(self.ui.up_color_edit.text())
         self.colorbar_min = float(self.ui.low_color_edit.text())
+        self.color_engine.set_range(self.colorbar_min, self.colorbar_max)
+        self._invalidate_colors()
         # self._update()
-        self.legendLabels = np.linspace(self.colorbar_max, self.colorbar_min, 5)
+        self._add_legend(self.colorbar_min, self.colorbar_max)
+
+    def _add_legend(self, vmin: float, vmax: float):
+        self.gll = self._legend_item(vmin, vmax)
+        self.ui.atlas_surface_view_widget.addItem(self.gll)
+
+    def _legend_item(self, vmin: float, vmax: float):
+        self.legendLabels = np.linspace(vmax, vmin, 5)
         self.legendPos = np.linspace(1, 0, 5)
         self.legend = dict(
             zip(map(str, np.around(self.legendLabels, 2)), self.legendPos)
         )
-        self.gll = gl.GLGradientLegendItem(
+        return gl.GLGradientLegendItem(
             pos=(10, 10),
             size=(20, 120),
             gradient=self.ui.atlas_surface_view_widget.color_map,
             labels=self.legend,
         )
-        self.ui.atlas_surface_view_widget.addItem(self.gll)
 
     def _on_speed_slider_changed(self):
-        if 0 <= self.time < self.max_time - self.ui.speed_slider.value():
-            self.time += self.ui.speed_slider.value()
-        self.ui.time_slider.setMaximum(
-            self.max_time - self.ui.speed_slider.value()
-        )  # 避免运行时超出时间轴阈值
-        if self.ui.start_btn.isChecked():
+        self.scheduler.setRate(self._playback_rate())
+        if self.ui.speed_slider.value() == 0:
+            # 速率为0时暂停播放, 而不是让时钟以0速率空转
+            if not self.ui.start_btn.isChecked():
+                self.ui.start_btn.setText("Start")
+                self.scheduler.stop()
+                self.ui.start_btn.setChecked(True)
+        elif self.ui.start_btn.isChecked():
             self.ui.start_btn.setText("Pause")
-            self.timer.start(300)
+            self.scheduler.start()
             self.ui.start_btn.setChecked(False)
-        else:
-            pass
+
+    def _playback_rate(self):
+        """由速度滑块得到播放速率(每秒播放的仿真时间), 滑块每增加1速率翻倍"""
+        value = self.ui.speed_slider.value()
+        if value == 0:
+            return 0.0
+        return (
+            self.scheduler.sample_period
+            * self.scheduler.targetFps()
+            * 2.0 ** (value - SPEED_SLIDER_UNITY)
+        )
 
     def _on_time_slider_changed(self):
-        self.time = self.ui.time_slider.value()
-        if self.ui.speed_slider.value() > 0:
-            self.timer.start(300)
+        if self._rendering:
+            return
+        self.scheduler.seek(self.ui.time_slider.value())
+        self._render_frame(self.scheduler.frame())
 
     def _on_update_btn_clicked(self):
         self.ui.atlas_surface_view_widget.removeItem(self.gll)
@@ -118,75 +259,245 @@ class RegionalTimeSeriesPage(BasePage):
             self.ui.speed_slider.setValue(0)
             self.ui.start_btn.setText("Start")
             self.ui.start_btn.setChecked(True)
-            self.timer.stop()
+            self.scheduler.stop()
         else:
             self.ui.start_btn.setText("Pause")
-            self.ui.speed_slider.setValue(10)
-            self.timer.start(300)
+            self.ui.speed_slider.setValue(SPEED_SLIDER_UNITY)
+            if self.scheduler.frame() >= self.max_time - 1:
+                self.scheduler.seek(0)
+            self.scheduler.start()
             self.ui.start_btn.setChecked(False)
 
     def _update(self):
         self.time = self.ui.time_slider.value()
-        #
-        # if self.list_selected_regions is not None:
-        self.selected_timeseries_data = np.zeros(self.timeseries.data.shape)
-        self.selected_timeseries_data[
-            :, self.list_selected_regions
-        ] = self.timeseries.data[:, self.list_selected_regions]
-
-        def _time_update():
-            if sip.isdeleted(self):
-                self.timer.stop()
-            else:
-                regionColor = (
-                    self.selected_timeseries_data[self.time] - self.colorbar_min
-                ) / (self.colorbar_max - self.colorbar_min)
-                self.ui.atlas_surface_view_widget.ampl = np.array(regionColor)[
-                    self.ui.atlas_surface_view_widget.labels
-                ]
-                colors = self.ui.atlas_surface_view_widget.color_map.map(
-                    self.ui.atlas_surface_view_widget.ampl, mode="float"
-                )
-                colors[
-                    self.selected_timeseries_data[
-                        self.time, np.squeeze(self.ui.atlas_surface_view_widget.labels)
-                    ]
-                    == 0,
-                    :,
-                ] = [0.7, 0.7, 0.7, 1]
-                self.ui.atlas_surface_view_widget.md.setVertexColors(colors)
-                self.ui.atlas_surface_view_widget.surface.vertexes = None
-                self.ui.atlas_surface_view_widget.surface.update()
-
-                self.ui.time_slider.setValue(self.time)
-                self.ui.time_edit.setText(
-                    str(round(self.timeseries.time[self.time], 4)) + self.timeseries.sample_unit.value
-                )  # 保留4位小数
-
-                if 0 <= self.time < self.max_time - self.ui.speed_slider.value():
-                    self.time += self.ui.speed_slider.value()
-                else:
-                    self.timer.stop()
-                    self.ui.speed_slider.setValue(0)
-                    self.ui.start_btn.setText("Start")
-                    self.ui.start_btn.setChecked(True)
-
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(_time_update)
+        self._set_region_mask(self.list_selected_regions)
+
+        # 按目标帧率调度播放, 渲染跟不上时丢弃中间帧
+        self.scheduler = PlaybackScheduler(
+            self.max_time, self.timeseries.sample_period, TARGET_FPS, self
+        )
+        self.scheduler.seek(self.time)
+        self.scheduler.frameRequested.connect(self._render_frame)
+        self.scheduler.statsChanged.connect(self._on_playback_stats_changed)
+        self.scheduler.finished.connect(self._on_playback_finished)
+
+    def _render_frame(self, frame: int):
+        if sip.isdeleted(self):
+            self.scheduler.stop()
+            return
+        self.time = frame
+        # 只读取当前帧, 通过查找表重写预分配的顶点颜色缓冲区中颜色发生变化的脑区,
+        # 未选中的脑区显示为底色
+        changed = self.color_prefetcher.colors_at(
+            self.time, self.scheduler.frameStep(), self.vertex_colors
+        )
+        self.ui.atlas_surface_view_widget.setVertexColors(self.vertex_colors, changed)
+        for view in self.comparisons:
+            view.render(self.time, self.scheduler.frameStep())
+
+        self._update_hover_label()
+
+        self._rendering = True
+        self.ui.time_slider.setValue(self.time)
+        self._rendering = False
+        self.ui.time_edit.setText(
+            str(round(self.timeseries.time[self.time], 4)) + self.timeseries.sample_unit.value
+        )  # 保留4位小数
+
+    def _on_region_hovered(self, region: int):
+        self._hovered_region = region
+        self._update_hover_label()
+
+    def _update_hover_label(self):
+        """显示鼠标悬停的脑区名称及其当前帧的数值"""
+        region = self._hovered_region
+        if region < 0 or region >= self.num_brainregion:
+            self.hover_label.setText("")
+            return
+        name = str(self.atlas.labels[region]).strip()
+        frame = self.series_data[self.time]
+        if self.per_vertex:
+            # 顶点级时间序列显示脑区内顶点的平均值
+            vertices = self.color_engine.regions.vertices([region])
+            value = float(np.asarray(frame)[vertices].mean()) if len(vertices) else 0.0
+        else:
+            value = float(frame[region])
+        self.hover_label.setText(f"{name}: {value:.4g}")
+
+    def _on_playback_stats_changed(self, fps: float, skipped: int):
+        self.fps_label.setText(f"{fps:.1f} fps, {skipped} skipped")
+
+    def _on_playback_finished(self):
+        self.ui.speed_slider.setValue(0)
+        self.ui.start_btn.setText("Start")
+        self.ui.start_btn.setChecked(True)
+
+    def _on_export_btn_clicked(self):
+        if self.exporter is not None:
+            self.exporter.cancel()
+            self._end_export()
+            show_info("Movie export cancelled", self.window())
+            return
+        dialog = MovieExportDialog(
+            self.max_time, self.colorbar_min, self.colorbar_max, self.window()
+        )
+        if not dialog.exec():
+            return
+
+        # 暂停播放
+        if not self.ui.start_btn.isChecked():
+            self.ui.start_btn.setChecked(True)
+            self._on_start_btn_clicked()
+        vmin, vmax = dialog.color_range
+        engine = copy.deepcopy(self.color_engine)
+        engine.set_range(vmin, vmax)
+
+        self.exporter = MovieExporter(
+            self.ui.atlas_surface_view_widget,
+            engine,
+            lambda t: self.series_data[t],
+            dialog.frames,
+            dialog.size,
+            dialog.path,
+            dialog.fps,
+        )
+        # 离屏视图中的图例显示导出所用的颜色范围
+        self.exporter.view.addItem(self._legend_item(vmin, vmax))
+        self.exporter.progressChanged.connect(self._on_export_progress)
+        self.exporter.finished.connect(self._on_export_finished)
+        self.exporter.failed.connect(self._on_export_failed)
+        self.export_btn.setText("Cancel Export")
+        self.ui.start_btn.setEnabled(False)
+        self.exporter.start()
+
+    def _on_export_progress(self, written: int, total: int):
+        self.fps_label.setText(f"exporting {written}/{total}")
+
+    def _on_export_finished(self, path: str):
+        self._end_export()
+        show_success(f"Movie saved to {path}", self.window())
+
+    def _on_export_failed(self, message: str):
+        self._end_export()
+        show_error(message, self.window())
+
+    def _end_export(self):
+        """导出结束后恢复按钮, 界面上的视图在导出期间没有被修改"""
+        self.exporter = None
+        self.export_btn.setText("Export Movie")
+        self.ui.start_btn.setEnabled(True)
+        self.fps_label.setText("")
+
+    def _on_compare_btn_clicked(self):
+        timeseries = self._select_time_series()
+        if timeseries is None:
+            return
+        if timeseries.data.shape[1] != self.n_columns:
+            show_error("The time series must have the same regions", self.window())
+            return
+        self._add_comparison(timeseries)
+
+    def _select_time_series(self):
+        """选择一个区域时间序列, 流程与分析页面加载数据相同"""
+        dialog = SelectData("Select Data", "", None, self)
+        dialog.exec()
+        if dialog.getflag() == "canel":
+            return None
+        data = dialog.get_data()
+        if isinstance(data, PSEResult):
+            pse_data_dialog = PSEDataDialog(data, "PSE data", self)
+            pse_data_dialog.exec()
+            if pse_data_dialog.getflag() == "canel":
+                return None
+            data = pse_data_dialog.get_data()
+        if isinstance(data, SimulationResult):
+            simulation_result_dialog = SimulationResultDialog(
+                data, "Simulation data", dialog.get_subject_or_dtb(), self
+            )
+            simulation_result_dialog.exec()
+            if simulation_result_dialog.getflag() == "canel":
+                return None
+            data = simulation_result_dialog.get_timeseries_data()
+        if not isinstance(data, RegionalTimeSeries):
+            return None
+        return data
+
+    def _add_comparison(self, timeseries: RegionalTimeSeries):
+        """添加与当前时间序列同步播放的对比视图, 共享几何数据, 颜色映射和播放时钟"""
+        view = ComparisonSurfaceView(
+            self.ui.atlas_surface_view_widget,
+            timeseries,
+            self.color_engine,
+            self.prefetch_frames,
+            self,
+        )
+        view.closeRequested.connect(lambda: self._remove_comparison(view))
+        index = self.ui.horizontalLayout_3.indexOf(self.ui.atlas_surface_view_widget)
+        index += len(self.comparisons) + 1
+        self.ui.horizontalLayout_3.insertWidget(index, view, 3)
+        self.comparisons.append(view)
+        self._sync_frame_count()
+        self._render_frame(self.scheduler.frame())
+
+    def _remove_comparison(self, view: ComparisonSurfaceView):
+        self.comparisons.remove(view)
+        self.ui.horizontalLayout_3.removeWidget(view)
+        view.shutdown()
+        view.deleteLater()
+        self._sync_frame_count()
+
+    def _on_montage_btn_toggled(self, checked: bool):
+        """在主表面视图和共享颜色缓冲区的多视角蒙太奇之间切换"""
+        widget = self.ui.atlas_surface_view_widget
+        if checked and self.montage is None:
+            self.montage = SurfaceMontageView(widget, self)
+            index = self.ui.horizontalLayout_3.indexOf(widget)
+            stretch = self.ui.horizontalLayout_3.stretch(index)
+            self.ui.horizontalLayout_3.insertWidget(index, self.montage, stretch)
+        if self.montage is not None:
+            self.montage.setVisible(checked)
+        widget.setVisible(not checked)
+
+    def _sync_frame_count(self):
+        """所有时间序列共用一个播放时钟, 帧数取最短的时间序列"""
+        self.max_time = min(
+            [self.series_data.shape[0]] + [view.n_frames for view in self.comparisons]
+        )
+        self.ui.time_slider.setMaximum(self.max_time - 1)
+        self.scheduler.n_frames = self.max_time
+        self.color_prefetcher.n_frames = self.max_time
+        if self.scheduler.frame() > self.max_time - 1:
+            self.scheduler.seek(self.max_time - 1)
+
+    def _invalidate_colors(self):
+        """颜色范围或脑区选择发生变化后, 丢弃所有视图已经预先计算的帧"""
+        self.color_prefetcher.invalidate()
+        for view in self.comparisons:
+            view.invalidate()
 
     def _on_region_signal_change(self, number_list_regions):
         self.select_regions(number_list_regions)
 
     def select_regions(self, selected_regions):
-        self.ui.time_series_widget.setSelectRegion(selected_regions)
+        if not self.per_vertex:
+            self.ui.time_series_widget.setSelectRegion(selected_regions)
         self.list_selected_regions = selected_regions
+        self._set_region_mask(selected_regions)
 
-        if self.list_selected_regions is not None and self.timeseries is not None:
-            self.selected_timeseries_data = np.zeros(self.timeseries.data.shape)
-            self.selected_timeseries_data[
-                :, self.list_selected_regions
-            ] = self.timeseries.data[:, self.list_selected_regions]
+    def _set_region_mask(self, selected_regions):
+        """根据被选中的脑区更新脑区掩码, 代价与脑区数量成正比, 与时间序列长度无关"""
+        self.region_mask = np.zeros(self.num_brainregion, dtype=bool)
+        if selected_regions is not None:
+            self.region_mask[selected_regions] = True
+        self.color_engine.set_region_mask(self.region_mask)
+        self._invalidate_colors()
 
     def closeEvent(self, event):
     # 停止定时器
-        self.timer.stop()
+        self.scheduler.stop()
+        self.color_prefetcher.shutdown()
+        for view in self.comparisons:
+            view.shutdown()
+        if self.exporter is not None:
+            self.exporter.cancel()
+        release_series_data(self.timeseries._gid.str)
@@ -128,4 +128,4 @@ class Ui_time_series_page(object):
 from qfluentwidgets import BodyLabel, LineEdit, PrimaryPushButton, Slider, StrongBodyLabel, TransparentTogglePushButton
 from zjb.gui.panels.brain_regions_panel import BrainRegionsPanel
 from zjb.gui.widgets.time_series_widget import TimeSeriesWidget
-from zjb.main.visualization.surface_space import AtlasSurfaceViewWidget
+from zjb.gui.widgets.atlas_surface_view_widget import AtlasSurfaceViewWidget
@@ -0,0 +1,311 @@
+import threading
+
+import numpy as np
+import pyqtgraph.opengl as gl
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtGui import QVector4D
+
+from zjb.main.visualization.surface_space import (
+    AtlasSurfaceViewWidget as _AtlasSurfaceViewWidget,
+)
+
+from ..common.colormaps import get_colormap
+from ..common.mesh_lod import LOD_VERTICES, MeshLOD
+from ..common.surface_cache import (
+    SharedMeshData,
+    SurfaceGeometry,
+    get_surface_geometry,
+)
+
+LOD_IDLE_MS = 300
+"""停止旋转或缩放后切换回完整网格的等待时间(ms)"""
+CLICK_TOLERANCE = 4
+"""按下和松开鼠标之间移动不超过该距离(像素)时视为点击"""
+HOVER_INTERVAL_MS = 16
+"""悬停拾取的最小间隔(ms), 期间的鼠标移动合并为一次拾取, 约每帧一次"""
+
+
+class AtlasSurfaceViewWidget(_AtlasSurfaceViewWidget):
+    """共享几何数据并支持细节层次(LOD)的图谱表面视图
+
+    同一个表面及脑区映射的顶点, 面, 法向量和顶点脑区编号在进程内只保存一份,
+    :py:meth:`setAtlas`先查找缓存, 每个视图的MeshData直接引用缓存中的数组,
+    只有顶点颜色是各自独立的.
+
+    对于高分辨率的表面, 在后台线程中生成保持脑区标签的简化网格. 旋转或缩放时渲染
+    简化网格, 停止交互:py:data:`LOD_IDLE_MS`毫秒后切换回完整网格.
+
+    顶点颜色通过:py:meth:`setVertexColors`原地更新, 只有颜色缓冲区本身被替换时才重新解析网格数据.
+
+    脑区拾取通过共享的三角形包围盒层次结构完成, 点击时发出`region_signal`,
+    鼠标悬停时发出:py:attr:`regionHovered`. 悬停拾取每:py:data:`HOVER_INTERVAL_MS`毫秒
+    最多进行一次, 只使用期间最后的鼠标位置.
+
+    Attributes
+    ----------
+    geometry : SurfaceGeometry
+        当前显示的表面的共享几何数据
+    """
+
+    geometry: "SurfaceGeometry | None" = None
+
+    # 鼠标悬停的脑区编号, 离开表面时为-1
+    regionHovered = pyqtSignal(int)
+    # 通过setVertexColors更新了顶点颜色
+    vertexColorsChanged = pyqtSignal()
+    # 开始(True)或结束(False)交互时渲染简化网格
+    lodActiveChanged = pyqtSignal(bool)
+    # 简化网格生成完成, 在后台线程中发出
+    _lodReady = pyqtSignal(object, object)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lod: "MeshLOD | None" = None
+        self._lod_md = None
+        # 完整网格顶点到简化网格顶点的索引, 不是代表顶点的为-1
+        self._lod_index = None
+        self._lod_active = False
+        self._lod_enabled = True
+        self._picking_enabled = True
+        self._lodReady.connect(self._on_lod_ready)
+        self._press_pos = None
+        self._hovered = -1
+        self.setMouseTracking(True)
+
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(LOD_IDLE_MS)
+        self._idle_timer.timeout.connect(self._end_interaction)
+
+        self._hover_pos = None
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(HOVER_INTERVAL_MS)
+        self._hover_timer.timeout.connect(self._on_hover_timeout)
+
+    def setAtlas(self, atlas, surface, surface_region_mapping):
+        self._end_interaction()
+        self._lod = self._lod_md = self._lod_index = None
+        # 先查找共享的几何数据, 缓存中不存在时才读取表面和脑区映射的数组
+        self.geometry = get_surface_geometry(
+            surface,
+            surface_region_mapping,
+            lambda: SurfaceGeometry(
+                surface.vertices, surface.faces, surface_region_mapping.data
+            ),
+        )
+        # MeshData直接引用共享数组, 不经过基类复制顶点和面并重新计算法向量
+        self.atlas = atlas
+        self.labels = self.geometry.labels
+        self.md = SharedMeshData(
+            self.geometry.vertices, self.geometry.faces, self.geometry.normals
+        )
+        surface_item = getattr(self, "surface", None)
+        if surface_item is not None and surface_item in self.items:
+            surface_item.setMeshData(meshdata=self.md)
+        else:
+            self.surface = gl.GLMeshItem(meshdata=self.md, smooth=True, shader="shaded")
+            self.addItem(self.surface)
+
+        self._start_prepare(self._picking_enabled, self._lod_enabled)
+
+    def setColorMap(self, name: str, source=None):
+        """设置颜色映射, 从进程级的颜色映射注册表中获取, 不再重复读取文件"""
+        self.color_map = get_colormap(name, source).color_map
+
+    def setVertexColors(self, colors: np.ndarray, changed=None):
+        """设置完整网格的顶点颜色
+
+        与上一次是同一个缓冲区时, 颜色已经原地写入, GLMeshItem直接引用该缓冲区,
+        只需重绘, 不再重新解析整个网格; 交互期间只同步`changed`中顶点的简化网格颜色.
+
+        Parameters
+        ----------
+        colors : np.ndarray
+            (顶点, 4)的float32顶点颜色
+        changed : np.ndarray, optional
+            自上一次设置以来颜色发生变化的顶点索引, 为None时视为全部变化
+        """
+        if changed is not None and len(changed) == 0:
+            return
+        if self.md.vertexColors() is not colors or not self.surface.opts["smooth"]:
+            # 非平滑着色时GLMeshItem使用按面展开的颜色副本, 必须重新解析
+            self.md.setVertexColors(colors)
+            changed = None
+            if not self._lod_active:
+                self.surface.vertexes = None
+        if self._lod_active:
+            self._sync_lod_colors(changed)
+        self.surface.update()
+        self.vertexColorsChanged.emit()
+
+    def setLodEnabled(self, enabled: bool):
+        """设置是否在交互时使用简化网格, 禁用时不再为新的表面生成简化网格"""
+        self._lod_enabled = enabled
+        if not enabled:
+            self._end_interaction()
+        elif self.geometry is not None and self._lod is None:
+            self._start_prepare(False, True)
+
+    def setPickingEnabled(self, enabled: bool):
+        """设置是否响应点击和悬停的脑区拾取, 禁用时不在后台构建包围盒层次结构"""
+        self._picking_enabled = enabled
+        if enabled and self.geometry is not None and not self.geometry.bvh_ready:
+            self._start_prepare(True, False)
+
+    def _start_prepare(self, bvh: bool, lod: bool):
+        if bvh or lod:
+            threading.Thread(
+                target=self._prepare_geometry,
+                args=(self.geometry, bvh, lod),
+                daemon=True,
+            ).start()
+
+    def _prepare_geometry(self, geometry: SurfaceGeometry, bvh: bool, lod: bool):
+        """在后台构建拾取用的包围盒层次结构和(或)简化网格"""
+        if bvh:
+            geometry.bvh()
+        if not lod:
+            return
+        lod = geometry.lod(LOD_VERTICES)
+        try:
+            self._lodReady.emit(geometry, lod)
+        except RuntimeError:
+            # 生成完成前视图已被销毁
+            pass
+
+    def _on_lod_ready(self, geometry, lod):
+        if geometry is not self.geometry or lod is None:
+            return
+        self._lod = lod
+        self._lod_md = SharedMeshData(lod.vertices, lod.faces, lod.normals)
+        self._lod_index = np.full(len(self.geometry.vertices), -1, dtype=np.intp)
+        self._lod_index[lod.representatives] = np.arange(lod.n_vertices)
+
+    @property
+    def lod(self) -> "MeshLOD | None":
+        """当前表面的简化网格, 尚未生成或不需要简化时为None"""
+        return self._lod
+
+    def _begin_interaction(self):
+        if self._lod_md is not None and self._lod_enabled and not self._lod_active:
+            self._lod_active = True
+            self._update_lod_colors()
+            self.surface.setMeshData(meshdata=self._lod_md)
+            self.lodActiveChanged.emit(True)
+        self._idle_timer.start()
+
+    def _end_interaction(self):
+        self._idle_timer.stop()
+        if self._lod_active:
+            self._lod_active = False
+            self.surface.setMeshData(meshdata=self.md)
+            self.lodActiveChanged.emit(False)
+
+    def _update_lod_colors(self):
+        """简化网格的顶点颜色取自其代表顶点在完整网格中的颜色"""
+        colors = self.md.vertexColors()
+        if colors is not None:
+            self._lod_md.setVertexColors(
+                colors.take(self._lod.representatives, axis=0)
+            )
+
+    def _sync_lod_colors(self, changed):
+        """把完整网格中`changed`顶点的颜色同步到简化网格, 为None时全部同步"""
+        lod_colors = self._lod_md.vertexColors()
+        if changed is None or lod_colors is None:
+            self._update_lod_colors()
+            self.surface.vertexes = None
+            return
+        lod_vertices = self._lod_index[changed]
+        representative = lod_vertices >= 0
+        lod_colors[lod_vertices[representative]] = self.md.vertexColors()[
+            changed[representative]
+        ]
+
+    def paintGL(self, *args, **kwargs):
+        # 交互期间页面更新了完整网格的颜色(置空了vertexes), 同步到简化网格
+        if self._lod_active and self.surface.vertexes is None:
+            self._update_lod_colors()
+        return super().paintGL(*args, **kwargs)
+
+    def pickRegion(self, pos) -> int:
+        """窗口坐标`pos`处的脑区编号, 没有命中表面时为-1"""
+        if self.geometry is None:
+            return -1
+        ray = self._ray(pos)
+        if ray is None:
+            return -1
+        return self.geometry.pick(*ray)
+
+    def _ray(self, pos):
+        """窗口坐标对应的射线(起点, 方向), 在表面的局部坐标系中"""
+        x = 2 * pos.x() / max(self.width(), 1) - 1
+        y = 1 - 2 * pos.y() / max(self.height(), 1)
+        mvp = self.projectionMatrix() * self.viewMatrix() * self.surface.transform()
+        inverse, invertible = mvp.inverted()
+        if not invertible:
+            return None
+        near = inverse.map(QVector4D(x, y, -1, 1)).toVector3DAffine()
+        far = inverse.map(QVector4D(x, y, 1, 1)).toVector3DAffine()
+        origin = (near.x(), near.y(), near.z())
+        direction = (far.x() - near.x(), far.y() - near.y(), far.z() - near.z())
+        return origin, direction
+
+    def _on_hover_timeout(self):
+        if self._hover_pos is not None:
+            self._hover(self._hover_pos)
+
+    def _hover(self, pos):
+        # 包围盒层次结构尚未构建完成时不阻塞界面
+        region = -1
+        if (
+            self._picking_enabled
+            and self.geometry is not None
+            and self.geometry.bvh_ready
+        ):
+            region = self.pickRegion(pos)
+        if region != self._hovered:
+            self._hovered = region
+            self.regionHovered.emit(region)
+
+    # 鼠标事件直接交给GLViewWidget处理相机, 拾取由本类完成
+    def mousePressEvent(self, ev):
+        self._hover_timer.stop()
+        self._press_pos = ev.pos()
+        self._begin_interaction()
+        gl.GLViewWidget.mousePressEvent(self, ev)
+
+    def mouseMoveEvent(self, ev):
+        if ev.buttons():
+            self._begin_interaction()
+            gl.GLViewWidget.mouseMoveEvent(self, ev)
+        else:
+            # 合并两次拾取之间的鼠标移动, 只拾取最后的位置
+            self._hover_pos = ev.pos()
+            if not self._hover_timer.isActive():
+                self._hover_timer.start()
+
+    def mouseReleaseEvent(self, ev):
+        gl.GLViewWidget.mouseReleaseEvent(self, ev)
+        if (
+            self._picking_enabled
+            and self._press_pos is not None
+            and (ev.pos() - self._press_pos).manhattanLength() <= CLICK_TOLERANCE
+        ):
+            region = self.pickRegion(ev.pos())
+            if region >= 0:
+                self.region_signal.emit(region)
+        self._press_pos = None
+
+    def leaveEvent(self, ev):
+        self._hover_timer.stop()
+        self._hover_pos = None
+        if self._hovered != -1:
+            self._hovered = -1
+            self.regionHovered.emit(-1)
+        super().leaveEvent(ev)
+
+    def wheelEvent(self, ev):
+        self._begin_interaction()
+        super().wheelEvent(ev)
@@ -0,0 +1,296 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QPainterPath
+
+from ..libs.pycircos import Garc
+
+REGION_COLORS = Garc.colorlist
+"""脑区的颜色, 按脑区编号循环使用, 与导出PDF时的环形图一致"""
+RING_INNER = 735
+"""脑区环的内半径, 也是连线端点所在的半径"""
+RING_OUTER = 785
+"""脑区环的外半径"""
+LABEL_RADIUS = 800
+"""脑区名称所在的半径"""
+ARC_GAP = 0.5
+"""相邻脑区的弧之间的间隔(度)"""
+CHORD_SEGMENTS = 16
+"""连线每段曲线(端点弧和贝塞尔曲线)的采样点数"""
+CHORD_ALPHA = 128
+"""连线的不透明度(0~255)"""
+DIMMED_ALPHA = 32
+"""悬停在脑区上时, 与其无关的连线的不透明度"""
+
+
+def region_arcs(n_regions: int):
+    """脑区的弧的起止角度(弧度, 从正上方顺时针)"""
+    gap = np.deg2rad(ARC_GAP)
+    span = (2 * np.pi - n_regions * gap) / max(n_regions, 1)
+    starts = np.arange(n_regions) * (span + gap)
+    return starts, starts + span
+
+
+def _polar(radius, angles):
+    return radius * np.sin(angles), radius * np.cos(angles)
+
+
+def _arc_angles(start, end, n=CHORD_SEGMENTS):
+    """(k,)的起止角度之间均匀采样的(k, n)角度"""
+    t = np.linspace(0, 1, n)
+    return start[:, None] + (end - start)[:, None] * t
+
+
+def chord_polygons(starts, ends, sources, targets):
+    """计算所有连线的轮廓
+
+    每个脑区的弧按连线的数量等分, 连线两端各占其中一份, 两端之间是经过圆心的二次贝塞尔曲线,
+    所有连线一次向量化计算.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        (脑区,)的弧的起止角度
+    sources, targets : np.ndarray
+        (连线,)的起点和终点脑区编号
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        (连线, 点)的轮廓的x和y坐标
+    """
+    regions = np.concatenate([sources, targets])
+    n_edges = len(sources)
+    if n_edges == 0:
+        empty = np.zeros((0, 4 * CHORD_SEGMENTS))
+        return empty, empty
+
+    # 每个端点在其脑区中的序号(按连线的顺序)
+    order = np.argsort(regions, kind="stable")
+    counts = np.bincount(regions, minlength=len(starts))
+    first = np.cumsum(counts) - counts
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order)) - first[regions[order]]
+
+    width = (ends - starts)[regions] / counts[regions]
+    lo = starts[regions] + width * (rank + 0.1)
+    hi = starts[regions] + width * (rank + 0.9)
+    a0, a1 = lo[:n_edges], hi[:n_edges]
+    b0, b1 = lo[n_edges:], hi[n_edges:]
+
+    t = np.linspace(0, 1, CHORD_SEGMENTS)
+    # 控制点为圆心的二次贝塞尔曲线: (1-t)^2 P0 + t^2 P2
+    u, v = (1 - t) ** 2, t**2
+
+    def bezier(p, q):
+        (px, py), (qx, qy) = _polar(RING_INNER, p), _polar(RING_INNER, q)
+        return px[:, None] * u + qx[:, None] * v, py[:, None] * u + qy[:, None] * v
+
+    source_x, source_y = _polar(RING_INNER, _arc_angles(a0, a1))
+    to_x, to_y = bezier(a1, b0)
+    target_x, target_y = _polar(RING_INNER, _arc_angles(b0, b1))
+    back_x, back_y = bezier(b1, a0)
+    x = np.concatenate([source_x, to_x, target_x, back_x], axis=1)
+    y = np.concatenate([source_y, to_y, target_y, back_y], axis=1)
+    return x, y
+
+
+def batched_path(x, y) -> QPainterPath:
+    """把(多边形, 点)的轮廓合并为一个路径, 每个多边形是一个子路径"""
+    connect = np.ones(x.shape, dtype=np.int32)
+    connect[:, -1] = 0
+    path = pg.arrayToQPath(x.ravel(), y.ravel(), connect.ravel())
+    path.setFillRule(Qt.WindingFill)
+    return path
+
+
+def grouped_paths(x, y, groups) -> "dict[int, QPainterPath]":
+    """按组(颜色)合并多边形, 每组一个路径"""
+    return {
+        int(group): batched_path(x[groups == group], y[groups == group])
+        for group in np.unique(groups)
+    }
+
+
+class ChordDiagramItem(pg.GraphicsObject):
+    """脑区连接的环形图(弦图)
+
+    每个脑区是环上的一段弧, 连线按起点脑区的颜色合并为少量的QPainterPath批量绘制,
+    可以流畅地显示数千条连线. 连线的几何在后台线程中计算, 只保留最新一次设置的结果.
+    鼠标悬停在脑区的弧上时突出显示与其相连的连线, 并发出:py:attr:`regionHovered`.
+    """
+
+    # 鼠标悬停的脑区编号, 离开脑区时为-1
+    regionHovered = pyqtSignal(int)
+    # 连线的几何计算完成, 在后台线程中发出
+    _geometryReady = pyqtSignal(int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.starts = self.ends = np.zeros(0)
+        self.sources = self.targets = np.zeros(0, dtype=np.intp)
+        self._ring_paths: "dict[int, QPainterPath]" = {}
+        self._chord_paths: "dict[int, QPainterPath]" = {}
+        self._chord_x = self._chord_y = np.zeros((0, 4 * CHORD_SEGMENTS))
+        self._labels: "list[pg.TextItem]" = []
+        self._hovered = -1
+        self._highlight = None
+        self._generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._geometryReady.connect(self._on_geometry_ready)
+        self.setAcceptHoverEvents(True)
+
+    def setRegions(self, labels):
+        """设置脑区, 每个脑区一段弧, 之前的连线被清除
+
+        Parameters
+        ----------
+        labels : ArrayLike
+            脑区名称
+        """
+        labels = [str(label).rstrip() for label in labels]
+        self.starts, self.ends = region_arcs(len(labels))
+        outer_x, outer_y = _polar(RING_OUTER, _arc_angles(self.starts, self.ends))
+        inner_x, inner_y = _polar(RING_INNER, _arc_angles(self.ends, self.starts))
+        self._ring_paths = grouped_paths(
+            np.concatenate([outer_x, inner_x], axis=1),
+            np.concatenate([outer_y, inner_y], axis=1),
+            np.arange(len(labels)) % len(REGION_COLORS),
+        )
+
+        for text in self._labels:
+            text.setParentItem(None)
+            if text.scene() is not None:
+                text.scene().removeItem(text)
+        self._labels = []
+        font = QFont()
+        font.setPointSize(6)
+        for label, angle in zip(labels, (self.starts + self.ends) / 2):
+            # 名称沿半径方向, 左半边翻转180度以免倒置
+            degrees = 90 - np.rad2deg(angle)
+            left = angle > np.pi
+            text = pg.TextItem(
+                label,
+                color="w",
+                anchor=(1, 0.5) if left else (0, 0.5),
+                angle=degrees + 180 if left else degrees,
+            )
+            text.setFont(font)
+            text.setParentItem(self)
+            text.setPos(*_polar(LABEL_RADIUS, angle))
+            self._labels.append(text)
+
+        self.setEdges([], [])
+        self.prepareGeometryChange()
+        self.update()
+
+    def setEdges(self, sources, targets):
+        """设置连线, 几何在后台线程中计算, 完成后重绘
+
+        Parameters
+        ----------
+        sources, targets : ArrayLike
+            (连线,)的起点和终点脑区编号
+        """
+        self._generation += 1
+        self._executor.submit(
+            self._build,
+            self._generation,
+            self.starts,
+            self.ends,
+            np.asarray(sources, dtype=np.intp),
+            np.asarray(targets, dtype=np.intp),
+        )
+
+    def _build(self, generation: int, starts, ends, sources, targets):
+        if generation != self._generation:
+            # 已有更新的连线, 跳过
+            return
+        x, y = chord_polygons(starts, ends, sources, targets)
+        paths = grouped_paths(x, y, sources % len(REGION_COLORS))
+        try:
+            self._geometryReady.emit(generation, (sources, targets, x, y, paths))
+        except RuntimeError:
+            # 计算完成前图形项已被销毁
+            pass
+
+    def _on_geometry_ready(self, generation: int, geometry):
+        if generation != self._generation:
+            return
+        self.sources, self.targets, self._chord_x, self._chord_y, self._chord_paths = (
+            geometry
+        )
+        self._update_highlight()
+        self.update()
+
+    def shutdown(self):
+        """停止后台线程"""
+        self._generation += 1
+        self._executor.shutdown(wait=False)
+
+    def regionAt(self, pos) -> int:
+        """位置所在的脑区(弧或其名称附近), 不在任何脑区上时返回-1"""
+        radius = np.hypot(pos.x(), pos.y())
+        if not RING_INNER <= radius <= LABEL_RADIUS or len(self.starts) == 0:
+            return -1
+        angle = np.arctan2(pos.x(), pos.y()) % (2 * np.pi)
+        region = int(np.searchsorted(self.starts, angle, side="right")) - 1
+        return region if region >= 0 and angle <= self.ends[region] else -1
+
+    def hoverEvent(self, ev):
+        region = -1 if ev.isExit() else self.regionAt(ev.pos())
+        if region != self._hovered:
+            self._hovered = region
+            self._update_highlight()
+            self.update()
+            self.regionHovered.emit(region)
+
+    def _update_highlight(self):
+        """合并与悬停脑区相连的连线"""
+        self._highlight = None
+        if self._hovered >= 0:
+            linked = (self.sources == self._hovered) | (self.targets == self._hovered)
+            if linked.any():
+                self._highlight = batched_path(
+                    self._chord_x[linked], self._chord_y[linked]
+                )
+
+    def boundingRect(self):
+        return QRectF(-RING_OUTER, -RING_OUTER, 2 * RING_OUTER, 2 * RING_OUTER)
+
+    def paint(self, p, *args):
+        p.setRenderHint(p.Antialiasing)
+        p.setPen(Qt.NoPen)
+        for group, path in self._ring_paths.items():
+            p.setBrush(pg.mkBrush(REGION_COLORS[group]))
+            p.drawPath(path)
+
+        alpha = CHORD_ALPHA if self._highlight is None else DIMMED_ALPHA
+        for group, path in self._chord_paths.items():
+            color = QColor(REGION_COLORS[group])
+            color.setAlpha(alpha)
+            p.setBrush(color)
+            p.drawPath(path)
+
+        if self._highlight is not None:
+            color = QColor(REGION_COLORS[self._hovered % len(REGION_COLORS)])
+            p.setBrush(color)
+            p.setPen(pg.mkPen("w", width=0.5, cosmetic=True))
+            p.drawPath(self._highlight)
+
+
+class ChordDiagramWidget(pg.GraphicsLayoutWidget):
+    """显示:py:class:`ChordDiagramItem`的视图, 保持纵横比, 可以缩放和平移"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setBackground("k")
+        self.view = self.addViewBox(lockAspect=True)
+        self.item = ChordDiagramItem()
+        self.view.addItem(self.item)
+        margin = LABEL_RADIUS + 150
+        self.view.setRange(
+            QRectF(-margin, -margin, 2 * margin, 2 * margin), padding=0
+        )
@@ -0,0 +1,139 @@
+import numpy as np
+import pyqtgraph.opengl as gl
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget
+from qfluentwidgets import BodyLabel, FluentIcon, TransparentToolButton
+
+from ..common.chunked_series import get_series_data, release_series_data
+from ..common.surface_cache import SharedMeshData
+from ..common.vertex_colors import VertexColorEngine, VertexColorPrefetcher
+
+
+class ComparisonSurfaceView(QWidget):
+    """与主表面视图同步播放的对比表面视图
+
+    顶点, 面和法向量数组来自主视图的共享几何数据, 相机参数与主视图共享同一个字典,
+    顶点颜色使用主视图的颜色计算引擎(颜色映射, 颜色范围和脑区选择与主视图一致),
+    每个对比视图只额外占用一个顶点颜色缓冲区.
+
+    主视图旋转或缩放时, 对比视图同样渲染主视图已经生成的简化网格, 不再单独简化.
+
+    Parameters
+    ----------
+    source : AtlasSurfaceViewWidget
+        主表面视图
+    timeseries : RegionalTimeSeries
+        要对比的时间序列
+    engine : VertexColorEngine
+        主视图的顶点颜色计算引擎
+    prefetch : int, optional
+        预先计算顶点颜色的帧数, by default 4
+    """
+
+    # 请求关闭该视图
+    closeRequested = pyqtSignal()
+
+    def __init__(
+        self,
+        source,
+        timeseries,
+        engine: VertexColorEngine,
+        prefetch: int = 4,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.source = source
+        self.timeseries = timeseries
+        self.series_data = get_series_data(timeseries)
+        self.engine = engine
+        self.vertex_colors = np.empty((engine.n_vertices, 4), dtype=np.float32)
+        self.prefetcher = VertexColorPrefetcher(
+            engine,
+            lambda t: self.series_data[t],
+            self.series_data.shape[0],
+            depth=prefetch,
+        )
+
+        self._lod = None
+        self._lod_md = None
+        self._lod_active = False
+
+        self._setup_ui(source)
+        source.lodActiveChanged.connect(self._set_lod_active)
+
+    def _setup_ui(self, source):
+        self.vBoxLayout = QVBoxLayout(self)
+        self.vBoxLayout.setContentsMargins(0, 0, 0, 0)
+        self.titleLayout = QHBoxLayout()
+        self.titleLabel = BodyLabel(str(self.timeseries), self)
+        self.closeButton = TransparentToolButton(FluentIcon.CLOSE, self)
+        self.closeButton.clicked.connect(self.closeRequested)
+        self.titleLayout.addWidget(self.titleLabel, 1)
+        self.titleLayout.addWidget(self.closeButton)
+        self.vBoxLayout.addLayout(self.titleLayout)
+
+        self.view = gl.GLViewWidget(self)
+        # 共享相机参数(包括背景色), 旋转或缩放任意一个视图, 所有视图在下一帧保持一致
+        self.view.opts = source.opts
+        self.vBoxLayout.addWidget(self.view, 1)
+
+        # 与主视图共享几何数据, 只有顶点颜色是独立的
+        geometry = source.geometry
+        self.md = SharedMeshData(geometry.vertices, geometry.faces, geometry.normals)
+        self.surface = gl.GLMeshItem(
+            meshdata=self.md,
+            smooth=source.surface.opts["smooth"],
+            shader=source.surface.shader(),
+        )
+        self.surface.setTransform(source.surface.transform())
+        self.view.addItem(self.surface)
+        self.view.md = self.md
+        self.view.surface = self.surface
+
+    def _set_lod_active(self, active: bool):
+        """与主视图同时切换简化网格, 简化网格来自主视图, 只有顶点颜色是独立的"""
+        lod = self.source.lod
+        if active and lod is not None:
+            if self._lod is not lod:
+                self._lod = lod
+                self._lod_md = SharedMeshData(lod.vertices, lod.faces, lod.normals)
+            self._lod_active = True
+            self._update_lod_colors()
+            self.surface.setMeshData(meshdata=self._lod_md)
+        elif not active and self._lod_active:
+            self._lod_active = False
+            self.surface.setMeshData(meshdata=self.md)
+
+    def _update_lod_colors(self):
+        """简化网格的顶点颜色取自其代表顶点在完整网格中的颜色"""
+        if self.md.vertexColors() is not None:
+            self._lod_md.setVertexColors(
+                self.vertex_colors.take(self._lod.representatives, axis=0)
+            )
+
+    @property
+    def n_frames(self):
+        return self.series_data.shape[0]
+
+    def render(self, frame: int, step: int):
+        """渲染第`frame`帧"""
+        changed = self.prefetcher.colors_at(frame, step, self.vertex_colors)
+        if changed is not None and len(changed) == 0:
+            return
+        if self.md.vertexColors() is not self.vertex_colors:
+            # 首次渲染, 之后颜色原地写入GLMeshItem引用的缓冲区, 不需要重新解析网格
+            self.md.setVertexColors(self.vertex_colors)
+            self.surface.vertexes = None
+        if self._lod_active:
+            self._update_lod_colors()
+            self.surface.vertexes = None
+        self.surface.update()
+        self.view.update()
+
+    def invalidate(self):
+        self.prefetcher.invalidate()
+
+    def shutdown(self):
+        self.source.lodActiveChanged.disconnect(self._set_lod_active)
+        self.prefetcher.shutdown()
+        release_series_data(self.timeseries._gid.str)
@@ -4,6 +4,16 @@ import numpy as np
 from pyqtgraph.Qt import QtGui
 from zjb.main.api import Connectivity
 import pyqtgraph as pg
+
+from ..common.colormaps import get_colormap
+from ..common.heatmap_pyramid import HeatmapPyramid
+from ..common.sparse_connectivity import (
+    as_csr,
+    is_sparse,
+    submatrix,
+    to_image,
+    value_range,
+)
 ConnectivityOrNone = typing.Optional[Connectivity]
 
 
@@ -19,11 +29,22 @@ class ConnectivityWidget(pg.GraphicsLayoutWidget):
         self.addLabel("Connectivity Views", colspan=2)
         self.nextRow()  # 标题
         self._connectivity = None
+        self._matrix = None
         self.br_selected = None
+        self.plotItem = None
+        self.pooling_mode = "max"
+        # 选中脑区的热图金字塔, 及当前显示的(层级, 行范围, 列范围)
+        self._pyramid = None
+        self._shown = None
 
     def setConnectivity(self, connectivity: ConnectivityOrNone):
-        """设置要可视化的连接矩阵"""
+        """设置要可视化的连接矩阵, 连接矩阵可以是scipy.sparse的稀疏矩阵"""
         self._connectivity = connectivity
+        self._matrix = None
+        if connectivity is not None:
+            # 稀疏矩阵只转换一次为CSR格式, 之后按行提取子矩阵
+            data = connectivity.data
+            self._matrix = as_csr(data) if is_sparse(data) else data
         if isinstance(self.br_selected, list):
             self._get_connectivity_data()
 
@@ -33,49 +54,120 @@ class ConnectivityWidget(pg.GraphicsLayoutWidget):
         if self._connectivity is not None:
             self._get_connectivity_data()
 
+    def setPoolingMode(self, mode: str):
+        """设置缩小显示时的块池化方式, :py:data:`.common.heatmap_pyramid.POOLING_MODES`之一"""
+        self.pooling_mode = mode
+        if self._pyramid is not None:
+            # 稀疏矩阵缩小后的图像也按新的方式重新池化
+            self._get_connectivity_data()
+
     def _get_connectivity_data(self):
         # 根据br_selected获得要显示的数据
         if len(self.br_selected) > 1:
             self.br_names = self._connectivity.space.atlas.labels
-            self.weights_all = self._connectivity.data # 全部脑区名字和权重矩阵
-            self.br_name_selected = np.squeeze(self.br_names[[self.br_selected]])
-            self.corrMatrix_selected = np.squeeze(self.weights_all[[self.br_selected]])
-            self.corrMatrix_selected = np.squeeze(self.corrMatrix_selected[:, [self.br_selected]])  # 被选中脑区的数据
-            self.clear() # 在画之前清除画布
+            self.weights_all = self._matrix # 全部脑区名字和权重矩阵
+            self.br_name_selected = np.asarray(self.br_names)[self.br_selected]
+            # 被选中脑区的数据, 稀疏矩阵只有显示的图像是稠密的
+            selected = submatrix(self.weights_all, self.br_selected)
+            self.weight_range = value_range(selected)
+            self.corrMatrix_selected = to_image(selected, mode=self.pooling_mode)
             self._update()
-        else:
-            self.clear()
-
-    def _update(self):
-
-        self.columns = self.br_name_selected # 被选中脑区的名字
-        self.weights = self.corrMatrix_selected
+        elif self.plotItem is not None:
+            self._pyramid = None
+            self.plotItem.hide()
 
+    def _setup_plot(self):
+        """创建绘图对象, 之后每次选择脑区都复用"""
         pg.setConfigOption('imageAxisOrder', 'row-major')  # Switch default order to Row-major
 
         self.correlogram = pg.ImageItem()
-        self.tr = QtGui.QTransform().translate(-0.5, -0.5)
-        self.correlogram.setTransform(self.tr)
-        self.correlogram.setImage(self.weights)
-
         self.plotItem = self.addPlot()  # add PlotItem to the main GraphicsLayoutWidget
-        self.plotItem.clearPlots()
         self.plotItem.setDefaultPadding(0.0)  # plot without padding data range
         self.plotItem.addItem(self.correlogram)  # display correlogram
 
         # show full frame, label tick marks at top and left sides, with some extra space for labels:
         self.plotItem.showAxes(True, showValues=(True, True, False, False), size=20)
-
-        # define major tick marks and labels:
-        self.ticks = [(idx, label) for idx, label in enumerate(self.columns)]
-        if len(self.ticks) <= 35:
-            for side in ('left', 'top', 'right', 'bottom'):
-                self.plotItem.getAxis(side).setTicks((self.ticks, []))  # add list of major ticks; no minor ticks
         self.plotItem.getAxis('bottom').setHeight(10)  # include some additional space at bottom of figure
 
-        self.colorMap = pg.colormap.get("viridis")  # choose perceptually uniform, diverging color map
-
-        self.bar = pg.ColorBarItem(values=(self.weights.min(), self.weights.max()), colorMap=self.colorMap)
+        self.colorMap = get_colormap("viridis").color_map  # choose perceptually uniform, diverging color map
+        self.bar = pg.ColorBarItem(colorMap=self.colorMap)
         # link color bar and color map to correlogram, and show it in plotItem:
         self.bar.setImageItem(self.correlogram, insert_in=self.plotItem)
 
+        # 缩放, 平移或改变大小时切换金字塔的层级和可见窗口
+        view_box = self.plotItem.getViewBox()
+        view_box.sigRangeChanged.connect(self._update_visible_image)
+        view_box.sigResized.connect(self._update_visible_image)
+
+    def _update(self):
+
+        self.columns = self.br_name_selected # 被选中脑区的名字
+        self.weights = self.corrMatrix_selected
+
+        if self.plotItem is None:
+            self._setup_plot()
+        self.plotItem.show()
+
+        # define major tick marks and labels:
+        self.ticks = [(idx, label) for idx, label in enumerate(self.columns)]
+        for side in ('left', 'top', 'right', 'bottom'):
+            # add list of major ticks; no minor ticks
+            self.plotItem.getAxis(side).setTicks(
+                (self.ticks, []) if len(self.ticks) <= 35 else None
+            )
+
+        self.bar.setLevels(values=self.weight_range)
+
+        # 稀疏矩阵的图像可能已经缩小, 每个像素对应cell_size个脑区
+        n = len(self.columns)
+        self._cell_size = n / self.weights.shape[0], n / self.weights.shape[1]
+        self._pyramid = HeatmapPyramid(self.weights, self.pooling_mode)
+        self._shown = None
+        self.plotItem.getViewBox().setRange(
+            xRange=(-0.5, n - 0.5), yRange=(-0.5, n - 0.5), padding=0
+        )
+        self._update_visible_image()
+
+    def _update_visible_image(self, *args):
+        """按每个屏幕像素覆盖的单元数选择金字塔的层级, 只显示可见窗口(及其周围)的图像"""
+        if self._pyramid is None:
+            return
+        view_box = self.plotItem.getViewBox()
+        if view_box.width() <= 0 or view_box.height() <= 0:
+            # 尚未显示, 显示时sigResized会再次触发
+            return
+        (x0, x1), (y0, y1) = view_box.viewRange()
+        pixel_size = view_box.viewPixelSize()
+        cells_per_pixel = max(
+            pixel_size[0] / self._cell_size[1], pixel_size[1] / self._cell_size[0]
+        )
+        level = self._pyramid.level_for(cells_per_pixel)
+        rows = ((y0 + 0.5) / self._cell_size[0], (y1 + 0.5) / self._cell_size[0])
+        columns = ((x0 + 0.5) / self._cell_size[1], (x1 + 0.5) / self._cell_size[1])
+        if self._shown is not None:
+            shown_level, shown_rows, shown_columns = self._shown
+            if (
+                shown_level == level
+                and shown_rows[0] <= rows[0]
+                and rows[1] <= shown_rows[1]
+                and shown_columns[0] <= columns[0]
+                and columns[1] <= shown_columns[1]
+            ):
+                return
+
+        image, (row, column) = self._pyramid.window(level, rows, columns)
+        size = self._pyramid.block_sizes[level]
+        self._shown = (
+            level,
+            (row, row + image.shape[0] * size),
+            (column, column + image.shape[1] * size),
+        )
+        self.correlogram.setImage(image, autoLevels=False)
+        self.correlogram.setLevels(self.bar.levels())
+        self.correlogram.setTransform(
+            QtGui.QTransform()
+            .translate(
+                column * self._cell_size[1] - 0.5, row * self._cell_size[0] - 0.5
+            )
+            .scale(size * self._cell_size[1], size * self._cell_size[0])
+        )
@@ -0,0 +1,120 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QFileDialog, QFormLayout, QHBoxLayout
+from qfluentwidgets import (
+    BodyLabel,
+    LineEdit,
+    MessageBoxBase,
+    PushButton,
+    SpinBox,
+    SubtitleLabel,
+)
+
+
+class MovieExportDialog(MessageBoxBase):
+    """表面时间序列动画导出设置对话框
+
+    Parameters
+    ----------
+    n_frames : int
+        时间序列的总帧数
+    vmin, vmax : float
+        默认的颜色范围
+    """
+
+    def __init__(self, n_frames: int, vmin: float, vmax: float, parent=None):
+        super().__init__(parent)
+        self._n_frames = n_frames
+
+        self._setup_ui()
+
+        self.end_spin.setValue(n_frames)
+        self.low_color_edit.setText(str(round(vmin, 2)))
+        self.up_color_edit.setText(str(round(vmax, 2)))
+
+    def _setup_ui(self):
+        self.viewLayout.addWidget(SubtitleLabel(self.tr("Export Movie:")))
+        self.yesButton.setText("Export")
+
+        self.formLayout = QFormLayout()
+        self.formLayout.setLabelAlignment(Qt.AlignmentFlag.AlignRight)
+        self.viewLayout.addLayout(self.formLayout)
+
+        # 文件路径, 格式由后缀决定
+        self.path_edit = LineEdit()
+        self.path_edit.setPlaceholderText("*.mp4 or *.gif")
+        self.path_edit.setMinimumWidth(260)
+        browse_btn = PushButton("...")
+        browse_btn.clicked.connect(self._browse)
+        path_layout = QHBoxLayout()
+        path_layout.addWidget(self.path_edit)
+        path_layout.addWidget(browse_btn)
+        self.formLayout.addRow(BodyLabel("file:"), path_layout)
+
+        # 帧范围及间隔
+        self.start_spin = self._spin_box(0, self._n_frames - 1, 0)
+        self.formLayout.addRow(BodyLabel("start frame:"), self.start_spin)
+        self.end_spin = self._spin_box(1, self._n_frames, self._n_frames)
+        self.formLayout.addRow(BodyLabel("end frame:"), self.end_spin)
+        self.stride_spin = self._spin_box(1, max(self._n_frames, 1), 1)
+        self.formLayout.addRow(BodyLabel("stride:"), self.stride_spin)
+        self.fps_spin = self._spin_box(1, 120, 30)
+        self.formLayout.addRow(BodyLabel("fps:"), self.fps_spin)
+
+        # 分辨率
+        self.width_spin = self._spin_box(16, 7680, 1280)
+        self.formLayout.addRow(BodyLabel("width:"), self.width_spin)
+        self.height_spin = self._spin_box(16, 4320, 720)
+        self.formLayout.addRow(BodyLabel("height:"), self.height_spin)
+
+        # 颜色范围
+        self.low_color_edit = LineEdit()
+        self.formLayout.addRow(BodyLabel("color min:"), self.low_color_edit)
+        self.up_color_edit = LineEdit()
+        self.formLayout.addRow(BodyLabel("color max:"), self.up_color_edit)
+
+    def _spin_box(self, minimum: int, maximum: int, value: int):
+        spin = SpinBox()
+        spin.setRange(minimum, maximum)
+        spin.setValue(value)
+        return spin
+
+    def _browse(self):
+        name, _ = QFileDialog.getSaveFileName(
+            self, "Export Movie", self.path_edit.text(), "Movie (*.mp4 *.gif)"
+        )
+        if name:
+            self.path_edit.setText(name)
+
+    def validate(self):
+        try:
+            float(self.low_color_edit.text())
+            float(self.up_color_edit.text())
+        except ValueError:
+            return False
+        return (
+            self.path.lower().endswith((".mp4", ".gif"))
+            and self.start_spin.value() < self.end_spin.value()
+        )
+
+    @property
+    def path(self):
+        return self.path_edit.text()
+
+    @property
+    def frames(self):
+        """要导出的帧序号"""
+        return range(
+            self.start_spin.value(), self.end_spin.value(), self.stride_spin.value()
+        )
+
+    @property
+    def fps(self):
+        return self.fps_spin.value()
+
+    @property
+    def size(self):
+        return self.width_spin.value(), self.height_spin.value()
+
+    @property
+    def color_range(self):
+        return float(self.low_color_edit.text()), float(self.up_color_edit.text())
@@ -0,0 +1,111 @@
+import numpy as np
+import pyqtgraph.opengl as gl
+from PyQt5.QtGui import QVector3D
+from PyQt5.QtWidgets import QGridLayout, QVBoxLayout, QWidget
+from qfluentwidgets import CaptionLabel
+
+from ..common.surface_cache import SharedMeshData
+
+MONTAGE_VIEWS = (
+    # (标题, 半球, 仰角, 方位角, 行, 列)
+    ("Left lateral", "left", 0, 180, 0, 0),
+    ("Left medial", "left", 0, 0, 0, 1),
+    ("Dorsal", "both", 90, -90, 0, 2),
+    ("Right lateral", "right", 0, 0, 1, 0),
+    ("Right medial", "right", 0, 180, 1, 1),
+    ("Ventral", "both", -90, -90, 1, 2),
+)
+"""蒙太奇布局中的视图, 内侧面视图只显示对应的半球"""
+
+
+class SurfaceMontageView(QWidget):
+    """图谱表面的多视角蒙太奇(左右半球的外侧面, 内侧面及背侧, 腹侧)
+
+    所有视图与主表面视图共享顶点, 法向量和顶点颜色缓冲区, 颜色每帧只由页面计算一次,
+    主视图通过`setVertexColors`更新颜色后各视图只需重绘.
+
+    Parameters
+    ----------
+    source : AtlasSurfaceViewWidget
+        主表面视图
+    """
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.geometry = source.geometry
+        """创建视图时主视图的表面几何, 主视图切换表面后需要重新创建蒙太奇"""
+        self.views: "list[gl.GLViewWidget]" = []
+        self.items: "list[gl.GLMeshItem]" = []
+        self.mds: "list[gl.MeshData]" = []
+
+        self.gridLayout = QGridLayout(self)
+        self.gridLayout.setContentsMargins(0, 0, 0, 0)
+        for title, hemisphere, elevation, azimuth, row, column in MONTAGE_VIEWS:
+            self.gridLayout.addWidget(
+                self._create_view(title, hemisphere, elevation, azimuth), row, column
+            )
+
+        source.vertexColorsChanged.connect(self.sync)
+        self.sync()
+
+    def _create_view(self, title, hemisphere, elevation, azimuth):
+        geometry = self.geometry
+        if hemisphere == "both":
+            faces = geometry.faces
+        else:
+            faces = geometry.hemisphere_faces()[hemisphere == "right"]
+
+        md = SharedMeshData(geometry.vertices, faces, geometry.normals)
+        item = gl.GLMeshItem(
+            meshdata=md,
+            smooth=self.source.surface.opts["smooth"],
+            shader=self.source.surface.shader(),
+        )
+        transform = self.source.surface.transform()
+        item.setTransform(transform)
+
+        view = gl.GLViewWidget()
+        view.setBackgroundColor(self.source.opts["bgcolor"])
+        view.addItem(item)
+        # 相机对准(变换后的)表面中心, 距离足以看到整个表面
+        lo, hi = geometry.vertices.min(axis=0), geometry.vertices.max(axis=0)
+        center = transform.map(QVector3D(*((lo + hi) / 2).tolist()))
+        view.setCameraPosition(
+            pos=center,
+            distance=float(np.linalg.norm(hi - lo)) * 1.1,
+            elevation=elevation,
+            azimuth=azimuth,
+        )
+
+        self.views.append(view)
+        self.items.append(item)
+        self.mds.append(md)
+
+        widget = QWidget(self)
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(CaptionLabel(title, widget))
+        layout.addWidget(view, 1)
+        return widget
+
+    def sync(self):
+        """与主视图的顶点颜色缓冲区同步并重绘所有视图"""
+        if not self.isVisible():
+            return
+        colors = self.source.md.vertexColors()
+        for md, item, view in zip(self.mds, self.items, self.views):
+            if md.vertexColors() is not colors or not item.opts["smooth"]:
+                # 颜色缓冲区被替换, 只需重新引用, 之后颜色原地更新
+                md.setVertexColors(colors)
+                item.vertexes = None
+            item.update()
+            view.update()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.sync()
+
+    def setShader(self, shader):
+        for item in self.items:
+            item.setShader(shader)
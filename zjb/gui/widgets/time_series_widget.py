@@ -1,4 +1,3 @@
-import random
 import typing
 
 import numpy as np
@@ -8,8 +7,21 @@ from QCustomPlot_PyQt5 import *
 
 from zjb.main.api import TimeSeries
 
+from ..common.colormaps import get_colormap
+from ..common.series_pyramid import SERIES_PYRAMIDS
+from ..common.series_stats import SERIES_STATISTICS
+
 TimeSeriesOrNone = typing.Optional[TimeSeries]
 
+POINTS_PER_PIXEL = 2
+"""每个像素显示的点数, 最小/最大值金字塔每个箱输出两个点"""
+MIN_PLOT_WIDTH = 500
+"""计算显示点数时使用的最小绘图宽度(像素)"""
+STACKED_COLOR_GROUPS = 8
+"""堆叠曲线模式中的颜色分组数, 即最多创建的绘图对象数"""
+TRACE_COLOR_MAP = "CET-C6"
+"""曲线颜色使用的颜色映射"""
+
 
 class TimeSeriesWidget(QCustomPlot):
     _time_series: TimeSeriesOrNone
@@ -40,14 +52,28 @@ class TimeSeriesWidget(QCustomPlot):
         )  # 图的大标题
         self.plotLayout().addElement(0, 0, self.title)
         self._time_series = None
+        self._pyramid = None
+        self._statistics = None
+        self._plottables = []
+        self._stacked = True
         self.list_br = None
 
+        self.xAxis.rangeChanged.connect(self._on_x_range_changed)
+        SERIES_STATISTICS.statisticsReady.connect(self._on_statistics_ready)
+        SERIES_PYRAMIDS.pyramidReady.connect(self._on_pyramid_ready)
+
     def setTimeSeries(self, time_series: TimeSeriesOrNone):
         """设置要可视化的时间序列"""
         self._time_series = time_series
         if isinstance(self.list_br, list):
             self._update()
 
+    def setStackedTraces(self, stacked: bool):
+        """设置是否使用堆叠曲线模式, 该模式下所有被选中脑区只由少量绘图对象绘制"""
+        self._stacked = stacked
+        if self._time_series is not None and isinstance(self.list_br, list):
+            self._update()
+
     def setSelectRegion(self, number_br):
         """被选择的脑区"""
         self.list_br = number_br
@@ -56,9 +82,6 @@ class TimeSeriesWidget(QCustomPlot):
 
     def _update(self):
         if self.list_br != None:
-            self.timeseries_data = (
-                self._time_series.data
-            )  # data: array[float], 时空序列数据,第一维固定为时间（时刻）数据，其中“：”为维度>=1的空间维度
             self.time_ticks = (
                 self._time_series.time
             )  # time = Array[float] 时间（时刻）维度，即时间值数组
@@ -71,47 +94,127 @@ class TimeSeriesWidget(QCustomPlot):
                 self._time_series.sample_period
             )  # sample_period = Float()  采样周期，若规律采样或进行重采样，则间隔一致
 
-            # 选取246个脑区的时间序列要展示的部分
-
-            max_axisY = max(np.ptp(self.timeseries_data, axis=0))  # 最大距离
-            y_offset = 0
-            timeseries_data_len = len(self.timeseries_data[:, 1])
-            self.clearGraphs()
-            for i in self.list_br:
-                self.addGraph()
-                if timeseries_data_len > 10000:
-                    step_timeseries = timeseries_data_len // 10000
-                    self.graph().setData(
-                        self.time_ticks[::step_timeseries],
-                        np.add(
-                            self.timeseries_data[
-                                ::step_timeseries,
-                                i,
-                            ],
-                            y_offset * max_axisY,
-                        ),
-                    )
-                else:
-                    self.graph().setData(
-                        self.time_ticks,
-                        np.add(self.timeseries_data[:, i], y_offset * max_axisY),
-                    )
-                # self.graph().setBrush(QBrush(QColor(0, 0, 25, 20)))  # 图像阴影的颜色
-                y_offset += 1
-
-                self.graph().setLineStyle(QCPGraph.LineStyle(1))  # 线条样式
-
-                # self.setBackground(QColor(0, 0, 0)) # 设置背景颜色
-                graphPen = QPen()
-                graphPen.setColor(
-                    QColor(
-                        random.randint(10, 255),
-                        random.randint(10, 255),
-                        random.randint(10, 255),
-                    )
-                )  # 线条的颜色 随机
-                graphPen.setWidthF(1)
-                self.graph().setPen(graphPen)
-
-            self.rescaleAxes()
+            # 时间序列的最小/最大值金字塔, 每个时间序列只在后台线程中构建一次
+            self._pyramid = SERIES_PYRAMIDS.get(self._time_series)
+            self._statistics = SERIES_STATISTICS.get(self._time_series)
+
+            self.clearPlottables()
+            self._plottables = []
+            if self._stacked:
+                # 堆叠曲线模式: 所有脑区以NaN分隔的线段按颜色分组绘制, 而不是每个脑区一个QCPGraph
+                colors = _trace_colors(min(len(self.list_br), STACKED_COLOR_GROUPS))
+                for color in colors:
+                    curve = QCPCurve(self.xAxis, self.yAxis)
+                    curve.setPen(_trace_pen(color))
+                    self._plottables.append(curve)
+            else:
+                colors = _trace_colors(len(self.list_br))
+                for color in colors:
+                    self.addGraph()
+                    # self.graph().setBrush(QBrush(QColor(0, 0, 25, 20)))  # 图像阴影的颜色
+
+                    self.graph().setLineStyle(QCPGraph.LineStyle(1))  # 线条样式
+
+                    # self.setBackground(QColor(0, 0, 0)) # 设置背景颜色
+                    self.graph().setPen(_trace_pen(color))  # 线条的颜色 来自颜色映射
+                    self._plottables.append(self.graph())
+
+            if self._pyramid is None:
+                # 金字塔构建完成后在_on_pyramid_ready中绘制
+                self.replot()
+                return
+            self._draw()
+
+    def _draw(self):
+        """绘制完整时间范围内的曲线"""
+        self._update_offset()
+        # 曲线数据只计算一次, 调整坐标轴范围时不再触发_on_x_range_changed重新计算
+        self.xAxis.blockSignals(True)
+        self._set_visible_data(self.time_ticks[0], self.time_ticks[-1])
+        self.rescaleAxes()
+        self.xAxis.blockSignals(False)
+        self.replot()
+
+    def _update_offset(self):
+        """曲线之间的纵向偏移(最大距离), 统计量在后台计算完成前先使用金字塔最粗一层的结果"""
+        if self._statistics is not None:
+            self.max_axisY = float(self._statistics.ptp.max())
+        else:
+            self.max_axisY = max(self._pyramid.ptp())
+
+    def _on_pyramid_ready(self, gid: str):
+        if (
+            self._time_series is not None
+            and self._pyramid is None
+            and gid == self._time_series._gid.str
+            and self.list_br is not None
+            and self._plottables
+        ):
+            self._pyramid = SERIES_PYRAMIDS.get(self._time_series)
+            if self._pyramid is not None:
+                self._draw()
+
+    def _on_statistics_ready(self, gid: str):
+        if (
+            self._time_series is not None
+            and self._statistics is None
+            and gid == self._time_series._gid.str
+            and self.list_br is not None
+        ):
+            self._statistics = SERIES_STATISTICS.get(self._time_series)
+            if (
+                self._statistics is None
+                or self._pyramid is None
+                or not self._plottables
+            ):
+                return
+            # 只更新纵向偏移和纵轴范围, 保留用户当前的缩放和平移
+            self._update_offset()
+            self._on_x_range_changed()
+            self.yAxis.rescale()
             self.replot()
+
+    def _on_x_range_changed(self):
+        """缩放或平移时, 按可见时间范围选择金字塔的层级并更新曲线数据"""
+        if self._pyramid is None or self.list_br is None or not self._plottables:
+            return
+        x_range = self.xAxis.range()
+        self._set_visible_data(x_range.lower, x_range.upper)
+
+    def _set_visible_data(self, t0, t1):
+        max_points = max(self.width(), MIN_PLOT_WIDTH) * POINTS_PER_PIXEL
+        keys, values = self._pyramid.window(t0, t1, self.list_br, max_points)
+        # 在一次运算中为所有被选中的脑区加上纵向偏移
+        values = values + np.arange(values.shape[1]) * self.max_axisY
+        if self._stacked:
+            n_groups = len(self._plottables)
+            for group, curve in enumerate(self._plottables):
+                curve.setData(*_nan_separated(keys, values[:, group::n_groups]))
+        else:
+            for y_offset, graph in enumerate(self._plottables):
+                graph.setData(keys, values[:, y_offset])
+
+
+def _trace_colors(n: int):
+    """从颜色映射中等间隔地取`n`个颜色, 同样的脑区数量总是得到同样的颜色"""
+    if n == 0:
+        return []
+    color_map = get_colormap(TRACE_COLOR_MAP)
+    return color_map.map(np.linspace(0, 1, n, endpoint=False), mode="byte")
+
+
+def _trace_pen(color):
+    graphPen = QPen()
+    graphPen.setColor(QColor(*(int(c) for c in color[:3])))
+    graphPen.setWidthF(1)
+    return graphPen
+
+
+def _nan_separated(keys, values):
+    """将(点数, 曲线数)的数据展平为以NaN分隔的单条曲线数据"""
+    n, k = values.shape
+    curve_keys = np.full((k, n + 1), np.nan)
+    curve_keys[:, :n] = keys
+    curve_values = np.full((k, n + 1), np.nan)
+    curve_values[:, :n] = values.T
+    return curve_keys.ravel(), curve_values.ravel()